@@ -0,0 +1,44 @@
+"""Import the Home Assistant component's HA-free modules without Home Assistant.
+
+The component package's __init__ pulls in Home Assistant, so benchmarks register an
+empty package named ``pwnagotchi_ble`` pointing at homeassistant/ and import the
+submodules (const, frames, state, processor) from it directly. ``load_plugin`` does the
+same for pwnagotchi/ble_beacon.py outside a Pwnagotchi install.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "pwnagotchi_ble"
+
+
+def load(name):
+    if PACKAGE not in sys.modules:
+        pkg = types.ModuleType(PACKAGE)
+        pkg.__path__ = [os.path.join(ROOT, "homeassistant")]
+        sys.modules[PACKAGE] = pkg
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def load_plugin():
+    """Import pwnagotchi/ble_beacon.py; outside a Pwnagotchi install, give it a bare Plugin base."""
+    try:
+        importlib.import_module("pwnagotchi.plugins")
+    except ImportError:
+        pkg = types.ModuleType("pwnagotchi")
+        plugins = types.ModuleType("pwnagotchi.plugins")
+
+        class Plugin:
+            options = {}
+
+        plugins.Plugin = Plugin
+        pkg.plugins = plugins
+        sys.modules["pwnagotchi"] = pkg
+        sys.modules["pwnagotchi.plugins"] = plugins
+    spec = importlib.util.spec_from_file_location("ble_beacon", os.path.join(ROOT, "pwnagotchi", "ble_beacon.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
@@ -0,0 +1,48 @@
+"""In-memory stand-in for the plugin's AF_BLUETOOTH raw HCI socket (no adapter needed)."""
+import errno
+import socket
+import struct
+
+HCI_COMMAND_PKT = 0x01
+HCI_EVENT_PKT = 0x04
+EVT_CMD_COMPLETE = 0x0E
+
+
+class FakeHCISocket:
+    """Records command packets and answers each with a Command Complete event.
+
+    ``statuses`` maps opcode -> status byte to return (default 0x00, Success). While
+    ``down`` is set, send fails with ENETDOWN like a socket bound to a downed adapter.
+    """
+
+    def __init__(self, statuses=None):
+        self.sent = []
+        self.statuses = dict(statuses or {})
+        self.closed = False
+        self.down = False
+        self._pending = []
+
+    def send(self, pkt):
+        if self.down:
+            raise OSError(errno.ENETDOWN, "Network is down")
+        pkt = bytes(pkt)
+        self.sent.append(pkt)
+        if len(pkt) >= 4 and pkt[0] == HCI_COMMAND_PKT:
+            opcode = int.from_bytes(pkt[1:3], "little")
+            status = self.statuses.get(opcode, 0x00)
+            self._pending.append(struct.pack("<BBBBHB", HCI_EVENT_PKT, EVT_CMD_COMPLETE, 4, 1, opcode, status))
+        return len(pkt)
+
+    def recv(self, bufsize):
+        if not self._pending:
+            raise socket.timeout("no pending HCI event")
+        return self._pending.pop(0)[:bufsize]
+
+    def settimeout(self, timeout):
+        pass
+
+    def fileno(self):
+        return -1
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,95 @@
+"""Micro-benchmark: per-advert title/index lookups, old sort-per-call vs bisect + memo.
+
+Run from the repo root:
+
+    python benchmarks/bench_const.py [-n 200000]
+
+Loads homeassistant/const.py and frames.py without the package __init__, so Home
+Assistant does not need to be installed.
+"""
+import argparse
+import random
+import struct
+import timeit
+
+from _component import load
+
+const = load("const")
+frames = load("frames")
+
+
+# --- the pre-bisect implementation, kept here only for comparison ---
+
+def _legacy_title(value, table):
+    last = next(iter(table.values()))
+    for thr, name in sorted(table.items(), key=lambda kv: kv[0]):
+        if value >= thr:
+            last = name
+        else:
+            break
+    return last
+
+
+def _legacy_index(value, table):
+    idx = 0
+    for thr, _ in sorted(table.items(), key=lambda kv: kv[0]):
+        if value >= thr:
+            idx += 1
+        else:
+            break
+    return idx
+
+
+def legacy_lookups(d):
+    ep = d["epochs"]
+    return (_legacy_index(ep, const.DEFAULT_AGE_TITLES), _legacy_title(ep, const.DEFAULT_AGE_TITLES),
+            _legacy_title(d["train_epochs"], const.DEFAULT_STRENGTH_TITLES),
+            _legacy_title(d["traveler_xp"], const.TRAVEL_TITLES))
+
+
+def current_lookups(d):
+    ep = d["epochs"]
+    return (const.age_index_from_epochs(ep), const.age_title_from_epochs(ep),
+            const.strength_title_from_train(d["train_epochs"]), const.traveler_title_from_xp(d["traveler_xp"]))
+
+
+def make_adverts(count, distinct):
+    """v6 frames whose counters only take `distinct` values, like a slowly ageing unit."""
+    rnd = random.Random(7)
+    base = [(rnd.randrange(60000), rnd.randrange(60000), rnd.randrange(5000)) for _ in range(distinct)]
+    out = []
+    for i in range(count):
+        ep, tr, xp = base[i % distinct]
+        out.append(struct.pack("<BHHHBHHBB", 6, 10, 20, ep, 90, xp, tr, 3, 1))
+    return out
+
+
+def bench(label, fn, adverts, repeat):
+    def run():
+        for mfr in adverts:
+            fn(frames.decode_frame(mfr))
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    per = best / len(adverts) * 1e6
+    print(f"{label:<28} {per:8.3f} us/advert")
+    return per
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=100_000, help="adverts per run")
+    ap.add_argument("--distinct", type=int, default=16, help="distinct counter tuples in the stream")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    adverts = make_adverts(args.n, args.distinct)
+    for mfr in adverts[:args.distinct]:
+        d = frames.decode_frame(mfr)
+        assert legacy_lookups(d) == current_lookups(d)
+
+    before = bench("sort per call (before)", legacy_lookups, adverts, args.repeat)
+    after = bench("bisect + lru memo (after)", current_lookups, adverts, args.repeat)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Replay harness and throughput benchmark for the Home Assistant decode path.
+
+Feeds BluetoothServiceInfoBleak-shaped adverts through the same code that each
+config entry's _update_from_adv runs (AdvertProcessor: state lookup, dedupe,
+decode, change detection, publish throttling) with a minimal stand-in for the
+dispatcher and for the sensor entities listening on it.
+
+    python benchmarks/bench_decode.py --devices 20 --proxies 4 --ticks 500
+    python benchmarks/bench_decode.py --dump adverts.jsonl      # save the synthetic stream
+    python benchmarks/bench_decode.py --replay adverts.jsonl    # replay a recorded stream
+    python benchmarks/bench_decode.py --json                    # machine-readable report
+
+A replay file holds one JSON object per advert:
+{"t": seconds, "address": "AA:BB:..", "name": "...", "rssi": -60, "mfr": "06..."}
+"""
+import argparse
+import json
+import random
+import statistics
+import struct
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from _component import load
+
+const = load("const")
+state_mod = load("state")
+processor_mod = load("processor")
+
+# Mirrors sensor._KEYS plus the presence binary sensor: one listener per entity.
+ENTITY_KEYS = (
+    "last_seen", "handshakes", "points", "epochs", "train_epochs", "cpu_temp", "age_index",
+    "age_title", "traveler_xp", "traveler_title", "strength_title", "face", "mood",
+) + tuple(state_mod.RATE_FIELDS)
+
+FRAME_FORMATS = {
+    3: "<BHHHBBBBBHH",
+    5: "<BHHHBHH",
+    6: "<BHHHBHHBB",
+}
+
+
+class ServiceInfo:
+    """The BluetoothServiceInfoBleak attributes _update_from_adv reads."""
+    __slots__ = ("address", "name", "rssi", "manufacturer_data", "t")
+
+    def __init__(self, address, name, rssi, mfr, t):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.manufacturer_data = {const.MANUFACTURER_ID: mfr}
+        self.t = t
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+
+    def __call__(self):
+        return self.now
+
+    def call_later(self, delay, fn):
+        timer = [self.now + delay, fn]
+        self._timers.append(timer)
+
+        def cancel():
+            if timer in self._timers:
+                self._timers.remove(timer)
+        return cancel
+
+    def advance(self, t):
+        self.now = max(self.now, t)
+        due = [tm for tm in self._timers if tm[0] <= self.now]
+        for tm in due:
+            self._timers.remove(tm)
+            tm[1](None)
+
+
+class Dispatcher:
+    """Stand-in for async_dispatcher_send plus the entities' _handle_update filters."""
+
+    def __init__(self):
+        self.signals = 0
+        self.writes = 0
+        self.writes_by_key = defaultdict(int)
+
+    def send(self, address, changed):
+        self.signals += 1
+        online = const.ONLINE_KEY in changed
+        for key in ENTITY_KEYS:
+            if key in changed or online:
+                self.writes += 1
+                self.writes_by_key[key] += 1
+        if online:
+            self.writes += 1  # presence binary sensor
+
+
+def encode(version, d):
+    if version == 3:
+        return struct.pack(FRAME_FORMATS[3], 3, d["hs"], d["pts"], d["ep"], d["tx2"], 255, 0, 0, 0, d["xp"], d["tr"])
+    if version == 5:
+        return struct.pack(FRAME_FORMATS[5], 5, d["hs"], d["pts"], d["ep"], d["tx2"], d["xp"], d["tr"])
+    return struct.pack(FRAME_FORMATS[6], 6, d["hs"], d["pts"], d["ep"], d["tx2"], d["xp"], d["tr"], d["face"], 1)
+
+
+def synthetic(devices, proxies, ticks, interval, change_p, versions, seed=1):
+    """Every device advertises each tick; every proxy relays every advert."""
+    rnd = random.Random(seed)
+    units = []
+    for i in range(devices):
+        units.append({
+            "address": f"B8:27:EB:00:{i // 256:02X}:{i % 256:02X}",
+            "name": f"gotchi{i}",
+            "version": versions[i % len(versions)],
+            "hs": rnd.randrange(500), "pts": rnd.randrange(5000), "ep": rnd.randrange(20000),
+            "tx2": 90, "xp": rnd.randrange(3000), "tr": rnd.randrange(2000), "face": 3,
+        })
+    out = []
+    for tick in range(ticks):
+        for i, u in enumerate(units):
+            if rnd.random() < change_p:
+                u["hs"] = (u["hs"] + rnd.randrange(1, 3)) & 0xFFFF
+                u["pts"] = (u["pts"] + rnd.randrange(1, 20)) & 0xFFFF
+                u["ep"] = (u["ep"] + 1) & 0xFFFF
+                u["tx2"] = rnd.randrange(80, 120)
+                u["face"] = rnd.randrange(1, 22)
+            mfr = encode(u["version"], u)
+            t = tick * interval + i * interval / max(1, devices)
+            for p in range(proxies):
+                out.append(ServiceInfo(u["address"], u["name"], -50 - 5 * p - rnd.randrange(5), mfr, t + p * 0.01))
+    return out
+
+
+def read_replay(path):
+    out = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                d = json.loads(line)
+                out.append(ServiceInfo(d["address"], d.get("name"), d.get("rssi"), bytes.fromhex(d["mfr"]), float(d["t"])))
+    out.sort(key=lambda s: s.t)
+    return out
+
+
+def dump(adverts, path):
+    with open(path, "w") as f:
+        for s in adverts:
+            f.write(json.dumps({"t": s.t, "address": s.address, "name": s.name, "rssi": s.rssi,
+                                "mfr": s.manufacturer_data[const.MANUFACTURER_ID].hex()}) + "\n")
+
+
+def make_pipeline(options):
+    clock = VirtualClock()
+    dispatcher = Dispatcher()
+    states = state_mod.StateStore(max_unpinned=0)
+    proc = processor_mod.AdvertProcessor(
+        states, state_mod.PresenceTracker(), dispatcher.send, clock.call_later,
+        options=lambda: options, clock=clock,
+    )
+
+    def update_from_adv(service_info):
+        # same shape as the closure in async_setup_entry
+        mfr = (service_info.manufacturer_data or {}).get(const.MANUFACTURER_ID)
+        if not mfr:
+            return None
+        return proc.process(service_info.address or "pwnagotchi", mfr, service_info.rssi)
+
+    return clock, dispatcher, proc, update_from_adv
+
+
+def run(adverts, options):
+    clock, dispatcher, proc, update = make_pipeline(options)
+    lat = []
+    perf = time.perf_counter_ns
+    t0 = perf()
+    for s in adverts:
+        clock.advance(s.t)
+        a = perf()
+        update(s)
+        lat.append(perf() - a)
+    total = perf() - t0
+    clock.advance(float("inf"))
+    lat.sort()
+    return {
+        "adverts": len(adverts),
+        "adverts_per_s": len(adverts) / (total / 1e9) if total else 0.0,
+        "p50_us": lat[len(lat) // 2] / 1e3 if lat else 0.0,
+        "p99_us": lat[min(len(lat) - 1, int(len(lat) * 0.99))] / 1e3 if lat else 0.0,
+        "mean_us": statistics.fmean(lat) / 1e3 if lat else 0.0,
+        "signals": dispatcher.signals,
+        "state_writes": dispatcher.writes,
+        "writes_per_advert": dispatcher.writes / len(adverts) if adverts else 0.0,
+    }
+
+
+def measure_allocations(adverts, options, sample=2000):
+    """tracemalloc pass: peak transient bytes and retained blocks per advert."""
+    clock, _, _, update = make_pipeline(options)
+    # warm up: first sight of each device allocates its state record
+    for s in adverts[: min(len(adverts), sample)]:
+        clock.advance(s.t)
+        update(s)
+    sample_set = adverts[min(len(adverts), sample): min(len(adverts), 2 * sample)] or adverts
+    tracemalloc.start()
+    peaks = []
+    before = tracemalloc.take_snapshot()
+    for s in sample_set:
+        clock.advance(s.t)
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        update(s)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    retained = sum(st.count_diff for st in stats if "tracemalloc" not in str(st.traceback))
+    return {
+        "peak_bytes_per_advert": statistics.fmean(peaks) if peaks else 0.0,
+        "retained_blocks_per_advert": retained / len(sample_set) if sample_set else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--devices", type=int, default=10, help="M beacons")
+    ap.add_argument("--proxies", type=int, default=3, help="N proxies relaying each advert")
+    ap.add_argument("--ticks", type=int, default=500, help="adverts per device")
+    ap.add_argument("--interval", type=float, default=20.0, help="beacon interval (s, virtual time)")
+    ap.add_argument("--change", type=float, default=0.3, help="probability a device's stats change per tick")
+    ap.add_argument("--versions", default="3,5,6", help="frame versions assigned round-robin to devices")
+    ap.add_argument("--min-publish", type=float, default=0.0, help="min_publish_interval option (s)")
+    ap.add_argument("--replay", help="replay a recorded JSONL advert stream instead of synthetic input")
+    ap.add_argument("--dump", help="write the input stream as JSONL and exit")
+    ap.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+
+    if args.replay:
+        adverts = read_replay(args.replay)
+    else:
+        versions = [int(v) for v in args.versions.split(",") if v]
+        adverts = synthetic(args.devices, args.proxies, args.ticks, args.interval, args.change, versions)
+    if args.dump:
+        dump(adverts, args.dump)
+        print(f"wrote {len(adverts)} adverts to {args.dump}", file=sys.stderr)
+        return
+
+    options = {const.CONF_MIN_PUBLISH_INTERVAL: args.min_publish}
+    report = run(adverts, options)
+    if not args.no_alloc:
+        report.update(measure_allocations(adverts, options))
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+    for key, value in report.items():
+        print(f"{key:<28} {value:,.2f}" if isinstance(value, float) else f"{key:<28} {value:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Byte-level check of the HCI commands the plugin sends, against a fake socket.
+
+Run from the repo root:
+
+    python benchmarks/check_hci.py
+
+Asserts the exact disable -> params -> data [-> scan response] -> enable packets of
+HCISocketAdvertiser.advertise, the status parsing of Command Complete / Command Status
+events, that a rejected command makes BLEBeacon retry instead of skipping, and that a
+downed adapter is brought back up (HCIDEVUP) without giving up on the socket.
+Exits non-zero on the first mismatch.
+"""
+import struct
+import sys
+
+from _component import load_plugin
+from _fake_hci import FakeHCISocket
+
+plugin = load_plugin()
+
+DISABLE = bytes.fromhex("010a200100")
+ENABLE = bytes.fromhex("010a200101")
+
+
+def params_packet(units, adv_type):
+    # 0x2006, 15 bytes: interval min/max, type, own/peer addr type, peer addr, channel map, filter
+    return bytes.fromhex("0106200f") + struct.pack("<HHBBB6sBB", units, units, adv_type, 0, 0, bytes(6), 0x07, 0)
+
+
+def check(name, got, want):
+    if got != want:
+        print(f"FAIL {name}:\n  got  {got!r}\n  want {want!r}", file=sys.stderr)
+        sys.exit(1)
+    print(f"ok   {name}")
+
+
+def check_advertise():
+    data = bytes(range(32))
+    fake = FakeHCISocket()
+    statuses = plugin.HCISocketAdvertiser(sock=fake).advertise(data, 0x0100)
+    check("advertise packets", fake.sent, [
+        DISABLE,
+        params_packet(0x0100, 0x03),  # ADV_NONCONN_IND
+        bytes.fromhex("01082020") + data,
+        ENABLE,
+    ])
+    check("advertise statuses", statuses, [0, 0, 0, 0])
+
+    scan = bytes(32)
+    fake = FakeHCISocket()
+    plugin.HCISocketAdvertiser(sock=fake).advertise(data, 0x0100, scan)
+    check("advertise with scan response", fake.sent, [
+        DISABLE,
+        params_packet(0x0100, 0x02),  # ADV_SCAN_IND
+        bytes.fromhex("01082020") + data,
+        bytes.fromhex("01092020") + scan,
+        ENABLE,
+    ])
+
+
+def check_status_parsing():
+    op = plugin.hci_opcode(plugin.OGF_LE_CTL, plugin.OCF_LE_SET_ADV_PARAMS)
+    check("opcode", op, 0x2006)
+    # Command Complete: ncmd, opcode, status
+    check("command complete", plugin.hci_parse_status(bytes.fromhex("040e0401062000"), op), 0x00)
+    check("command complete error", plugin.hci_parse_status(bytes.fromhex("040e040106200c"), op), 0x0C)
+    # Command Status: status, ncmd, opcode
+    check("command status", plugin.hci_parse_status(bytes.fromhex("040f040c010620"), op), 0x0C)
+    check("other opcode", plugin.hci_parse_status(bytes.fromhex("040e0401082000"), op), None)
+    check("not an event", plugin.hci_parse_status(bytes.fromhex("01062000"), op), None)
+
+    fake = FakeHCISocket({op: 0x0C})
+    statuses = plugin.HCISocketAdvertiser(sock=fake).advertise(bytes(32), 0x0800)
+    check("rejected params", statuses, [0x00, 0x0C, 0x00, 0x00])
+
+
+def check_skip_and_retry():
+    beacon = plugin.BLEBeacon()
+    beacon.opts["diag_path"] = ""
+    fake = FakeHCISocket({0x2006: 0x0C})
+    beacon._adv = plugin.HCISocketAdvertiser(sock=fake)
+    beacon._advertise_if_changed(b"\x06payload")
+    check("rejected command counts as failed", beacon.counters, {"programmed": 0, "skipped": 0, "failed": 1})
+    fake.statuses.clear()
+    beacon._advertise_if_changed(b"\x06payload")
+    beacon._advertise_if_changed(b"\x06payload")
+    check("retry then skip", beacon.counters, {"programmed": 1, "skipped": 1, "failed": 1})
+
+
+def check_adapter_down():
+    fake = FakeHCISocket()
+    raised = []
+
+    def dev_up(sock, dev_id):
+        raised.append(dev_id)
+        fake.down = False
+
+    real_dev_up, plugin.hci_dev_up = plugin.hci_dev_up, dev_up
+    try:
+        fake.down = True
+        statuses = plugin.HCISocketAdvertiser("hci1", sock=fake).advertise(bytes(32), 0x0800)
+    finally:
+        plugin.hci_dev_up = real_dev_up
+    check("ENETDOWN brings the adapter up", raised, [1])
+    check("ENETDOWN then retried", statuses, [0, 0, 0, 0])
+
+    # an error that HCIDEVUP cannot fix: the beacon keeps the socket backend for the next tick
+    beacon = plugin.BLEBeacon()
+    beacon.opts.update(diag_path="", backend="socket")
+    fake = FakeHCISocket()
+    fake.down = True
+    adv = beacon._adv = plugin.HCISocketAdvertiser(sock=fake)
+    real_dev_up, plugin.hci_dev_up = plugin.hci_dev_up, lambda sock, dev_id: None
+    try:
+        beacon._advertise_if_changed(b"\x06payload")
+    finally:
+        plugin.hci_dev_up = real_dev_up
+    check("socket error counts as failed", beacon.counters["failed"], 1)
+    check("socket closed", fake.closed, True)
+    check("socket backend kept", beacon._adv is adv, True)
+
+
+def check_hcitool_unparsed():
+    class Done:
+        returncode = 0
+        stdout = b"< HCI Command: ogf 0x08, ocf 0x0008, plen 32\n"
+        stderr = b""
+
+    adv = plugin.HcitoolAdvertiser()
+    adv._run = lambda cmd: Done()
+    check("hcitool without an event", adv.command(plugin.OCF_LE_SET_ADV_DATA, bytes(32)), plugin.HCI_STATUS_NO_REPLY)
+
+
+def main():
+    check_advertise()
+    check_status_parsing()
+    check_skip_and_retry()
+    check_adapter_down()
+    check_hcitool_unparsed()
+
+
+if __name__ == "__main__":
+    main()
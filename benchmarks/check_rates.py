@@ -0,0 +1,75 @@
+"""Check of the counter arithmetic behind the totals and per-hour rates.
+
+Run from the repo root:
+
+    python benchmarks/check_rates.py
+
+Covers the wrap, reset and out-of-order (stale relay) cases of counter_delta,
+CounterTotals and RateWindow. Exits non-zero on the first mismatch.
+"""
+import sys
+
+from _component import load
+
+rates = load("rates")
+
+
+def check(name, got, want):
+    if got != want:
+        print(f"FAIL {name}:\n  got  {got!r}\n  want {want!r}", file=sys.stderr)
+        sys.exit(1)
+    print(f"ok   {name}")
+
+
+def check_counter_delta():
+    check("increase", rates.counter_delta(10, 15), 5)
+    check("unchanged", rates.counter_delta(10, 10), 0)
+    check("wrap", rates.counter_delta(0xFFFE, 3), 5)
+    check("reset to zero", rates.counter_delta(500, 0), 0)
+    check("reset near zero", rates.counter_delta(500, 4), 4)
+    check("reset from far up", rates.counter_delta(30000, 5000), 5000)
+    check("out of order", rates.counter_delta(11, 10), None)
+    check("out of order high", rates.counter_delta(20000, 19990), None)
+
+
+def widened(readings):
+    totals = rates.CounterTotals()
+    out = []
+    for value in readings:
+        values = {"handshakes": value}
+        totals.widen(values, ["handshakes"])
+        out.append(values["handshakes"])
+    return out, totals
+
+
+def check_totals():
+    check("totals across a wrap", widened([0xFFF0, 0xFFFF, 0x0005])[0], [0xFFF0, 0xFFFF, 0x10005])
+    check("totals across a reset", widened([200, 210, 2, 5])[0], [200, 210, 212, 215])
+    out, totals = widened([10, 11, 10, 12])
+    check("stale relay keeps the total", out, [10, 11, 11, 12])
+    check("stale relay keeps last", totals.last, {"handshakes": 12})
+
+
+def windowed(readings, step=60.0):
+    window = rates.RateWindow(3600.0, 60)
+    for i, value in enumerate(readings):
+        window.add(i * step, value)
+    return window.rate(len(readings) * step)
+
+
+def check_window():
+    # five readings a minute apart, rate read at 5 min: 4 increments = 48/h, 3 = 36/h
+    check("rate", windowed([0, 1, 2, 3, 4]), 48.0)
+    check("rate across a wrap", windowed([0xFFFE, 0xFFFF, 0, 1, 2]), 48.0)
+    check("rate across a reset", windowed([500, 501, 0, 1, 2]), 36.0)
+    check("rate ignores a stale relay", windowed([10, 11, 10, 12, 13]), 36.0)
+
+
+def main():
+    check_counter_delta()
+    check_totals()
+    check_window()
+
+
+if __name__ == "__main__":
+    main()
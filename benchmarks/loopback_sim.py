@@ -0,0 +1,312 @@
+"""End-to-end loopback simulator: BLEBeacon encoder -> virtual radio -> HA decoder.
+
+Runs the real plugin headless against fake age/traveler JSON and thermal files, with
+a virtual HCI socket in place of the adapter. Every LE Set Advertising Data command
+goes "on air"; each virtual proxy receives the current advert once per controller
+advertising interval, subject to loss, jitter and duplication, and hands it to the
+Home Assistant AdvertProcessor. A workload thread changes the stats like a working
+unit would (handshakes, epochs, temperature, face) and the simulator checks that what
+HA decoded matches what was written, and how long each change took to arrive.
+
+    python benchmarks/loopback_sim.py --duration 20
+    python benchmarks/loopback_sim.py --modes adaptive --loss 0.3 --jitter 0.2 --dup 0.1
+
+Modes: fixed (interval only), event (interval + event wake-ups), adaptive (adaptive
+interval + event wake-ups), rotate (event + health/session frames rotated in).
+Intervals are scaled down so a run takes seconds.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from _component import load, load_plugin
+from _fake_hci import FakeHCISocket
+
+const = load("const")
+frames = load("frames")
+state_mod = load("state")
+processor_mod = load("processor")
+
+
+plugin = load_plugin()
+
+MODES = {
+    "fixed": {"event_driven": False, "schedule": "fixed"},
+    "event": {"event_driven": True, "schedule": "fixed"},
+    "adaptive": {"event_driven": True, "schedule": "adaptive"},
+    # core frame plus health/session frames rotated in (periods scaled down from 60/120 s)
+    "rotate": {"event_driven": True, "schedule": "fixed", "health_s": 3, "session_s": 6, "frame_dwell_s": 0.5},
+}
+
+FIELDS = ("handshakes", "points", "epochs", "train_epochs", "traveler_xp", "cpu_temp", "face")
+
+
+def check_tables():
+    """The plugin and the integration keep separate copies of these tables."""
+    problems = []
+    if plugin.FACE_TABLE != const.FACE_ID_TO_FACE:
+        problems.append("FACE_TABLE differs from const.FACE_ID_TO_FACE")
+    if plugin.FACE_REV != const.FACE_REV:
+        problems.append("FACE_REV differs")
+    for ver, schema in plugin.FRAME_SCHEMAS.items():
+        ha = frames.FRAME_SCHEMAS.get(ver)
+        if ha is None:
+            problems.append(f"frame v{ver} has no decoder")
+        elif ha.codec.format != schema.codec.format:
+            problems.append(f"frame v{ver}: plugin {schema.codec.format} != HA {ha.codec.format}")
+        elif tuple(name for name, _cap in schema.varints) != ha.varints:
+            problems.append(f"frame v{ver}: plugin varints {schema.varints} != HA {ha.varints}")
+    return problems
+
+
+def mfr_from_adv_data(data):
+    """Manufacturer payload (after the company id) from LE Set Advertising Data params."""
+    n = data[0]
+    ad = data[1:1 + n]
+    i = 0
+    while i < len(ad):
+        ln = ad[i]
+        if ln == 0:
+            break
+        if ad[i + 1] == 0xFF:
+            return bytes(ad[i + 4:i + 1 + ln])
+        i += 1 + ln
+    return None
+
+
+class Radio(FakeHCISocket):
+    """Virtual adapter: the HCI socket the plugin writes to, plus the air between it and the proxies."""
+
+    def __init__(self, proxies, loss, jitter, dup, seed=3):
+        super().__init__()
+        self.rnd = random.Random(seed)
+        self.proxies, self.loss, self.jitter, self.dup = proxies, loss, jitter, dup
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.current = None
+        self.interval = 1.28
+        self.next_air = 0.0
+        self.queue = []  # (deliver_at, seq, proxy, mfr)
+        self.seq = 0
+        self.air_count = 0
+
+    def send(self, pkt):
+        n = super().send(pkt)
+        opcode = int.from_bytes(pkt[1:3], "little")
+        params = bytes(pkt[4:])
+        with self.lock:
+            if opcode == plugin.hci_opcode(plugin.OGF_LE_CTL, plugin.OCF_LE_SET_ADV_DATA):
+                self.current = mfr_from_adv_data(params)
+            elif opcode == plugin.hci_opcode(plugin.OGF_LE_CTL, plugin.OCF_LE_SET_ADV_PARAMS):
+                self.interval = int.from_bytes(params[0:2], "little") * 0.000625
+            elif opcode == plugin.hci_opcode(plugin.OGF_LE_CTL, plugin.OCF_LE_SET_ADV_ENABLE):
+                self.enabled = params[:1] == b"\x01"
+                if self.enabled:
+                    self.next_air = time.monotonic()  # first advert goes out right after enable
+        return n
+
+    def step(self, now):
+        """Put due adverts on the air; return deliveries that reached a proxy by now."""
+        with self.lock:
+            while self.enabled and self.current and now >= self.next_air:
+                self.air_count += 1
+                for proxy in range(self.proxies):
+                    if self.rnd.random() < self.loss:
+                        continue
+                    copies = 2 if self.rnd.random() < self.dup else 1
+                    for _ in range(copies):
+                        self.seq += 1
+                        at = self.next_air + self.rnd.uniform(0, self.jitter)
+                        heapq.heappush(self.queue, (at, self.seq, proxy, self.current))
+                self.next_air += self.interval
+            out = []
+            while self.queue and self.queue[0][0] <= now:
+                out.append(heapq.heappop(self.queue))
+            return out
+
+
+class Unit:
+    """Fake Pwnagotchi filesystem + UI the plugin reads from."""
+
+    def __init__(self, root):
+        self.age = os.path.join(root, "age_strength.json")
+        self.traveler = os.path.join(root, "pwn_traveler.json")
+        self.thermal = os.path.join(root, "thermal_temp")
+        self.truth = {"handshakes": 0, "points": 0, "epochs": 0, "train_epochs": 0,
+                      "traveler_xp": 0, "cpu_temp": 45.0, "face": plugin.FACE_TABLE[3]}
+        self.face = self.truth["face"]
+        self.write()
+
+    def get(self, key):  # the ui.get("face") the plugin calls from on_ui_update
+        return self.face if key == "face" else None
+
+    def _atomic(self, path, text):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def write(self):
+        t = self.truth
+        self._atomic(self.age, json.dumps({"handshakes": t["handshakes"], "points": t["points"],
+                                           "epochs": t["epochs"], "train_epochs": t["train_epochs"]}))
+        self._atomic(self.traveler, json.dumps({"travel_xp": t["traveler_xp"]}))
+        # sysfs files change in place (the plugin keeps them open)
+        with open(self.thermal, "w") as f:
+            f.write("%d\n" % int(t["cpu_temp"] * 1000))
+
+
+def run_mode(mode, args):
+    tmp = tempfile.mkdtemp(prefix="ble_sim_")
+    unit = Unit(tmp)
+    radio = Radio(args.proxies, args.loss, args.jitter, args.dup)
+    rnd = random.Random(11)
+
+    beacon = plugin.BLEBeacon()
+    beacon.options = dict(MODES[mode], age_json=unit.age, traveler_json=unit.traveler, thermal_path=unit.thermal,
+                          interval_s=args.interval, min_interval_s=args.interval / 4, max_interval_s=args.interval * 4,
+                          min_update_s=args.min_update, refresh_s=args.interval * 10, adv_interval_ms=200,
+                          adv_per_update=4, temp_sample_s=0, diag_path="")
+    beacon._adv = plugin.HCISocketAdvertiser(sock=radio)
+
+    # CPU spent by the beacon thread per tick
+    cpu = []
+    inner = beacon._advertise_if_changed
+
+    def timed(*args):
+        t = time.thread_time()
+        try:
+            return inner(*args)
+        finally:
+            cpu.append(time.thread_time() - t)
+    beacon._advertise_if_changed = timed
+
+    # HA side
+    states = state_mod.StateStore()
+    decoded = []
+    proc = processor_mod.AdvertProcessor(
+        states, state_mod.PresenceTracker(), lambda address, changed: decoded.append((time.monotonic(), address)),
+        lambda delay, fn: (lambda: None), options=dict,
+    )
+    address = "B8:27:EB:51:4D:00"
+
+    changes = []  # (t_written, snapshot of truth)
+    latencies = []
+    seen_values = set()
+    pending = []
+
+    def ha_view():
+        st = states.get(address)
+        return None if st is None else tuple(st.get(k) for k in FIELDS)
+
+    def truth_view():
+        t = unit.truth
+        return tuple(t[k] for k in FIELDS)
+
+    initial = truth_view()
+    beacon.on_ui_update(unit)
+    beacon.on_loaded()
+    start = time.monotonic()
+    next_change = start + 0.5
+    stop_at = start + args.duration
+    while True:
+        now = time.monotonic()
+        if now >= stop_at:
+            break
+        if now >= next_change:
+            t = unit.truth
+            t["handshakes"] += 1
+            t["points"] += rnd.randrange(1, 10)
+            t["epochs"] += 1
+            t["cpu_temp"] = rnd.randrange(80, 130) / 2.0
+            if rnd.random() < 0.5:
+                unit.face = rnd.choice(list(plugin.FACE_TABLE.values()))
+                t["face"] = unit.face
+            unit.write()
+            beacon.on_handshake(None, None, None, None)
+            beacon.on_ui_update(unit)
+            view = truth_view()
+            changes.append((now, view))
+            pending.append((now, view))
+            next_change = now + rnd.uniform(args.change_every / 2, args.change_every * 1.5)
+        for _, _, proxy, mfr in radio.step(now):
+            proc.process(address, mfr, -60 - proxy)
+            view = ha_view()
+            seen_values.add(view)
+            while pending and view == pending[0][1]:
+                latencies.append(now - pending.pop(0)[0])
+            # a later change overtook an earlier one: the earlier one was never visible on its own
+            for i, (_, v) in enumerate(pending):
+                if v == view:
+                    for t0, _ in pending[:i + 1]:
+                        latencies.append(now - t0)
+                    del pending[:i + 1]
+                    break
+        time.sleep(0.002)
+    beacon.on_unloaded()
+
+    # Fields come from separate files written one after another, so HA may briefly see a
+    # mix of old and new fields. Fidelity means every decoded field value is one that
+    # field really had; anything else is an encode/decode error.
+    history = [{initial[i]} | {v[i] for _, v in changes} for i in range(len(FIELDS))]
+    bogus = [v for v in seen_values if v is not None and any(x not in history[i] for i, x in enumerate(v))]
+    final_ok = ha_view() == truth_view() or bool(pending)
+    lat = sorted(latencies)
+    return {
+        "mode": mode,
+        "changes": len(changes),
+        "delivered": len(changes) - len(pending),
+        "lost_or_late": len(pending),
+        "corrupt_states": len(bogus),
+        "final_state_ok": final_ok,
+        "latency_p50_ms": lat[len(lat) // 2] * 1e3 if lat else None,
+        "latency_p99_ms": lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1e3 if lat else None,
+        "ticks": len(cpu),
+        "programmed": beacon.counters["programmed"],
+        "skipped": beacon.counters["skipped"],
+        "cpu_us_per_tick": statistics.fmean(cpu) * 1e6 if cpu else None,
+        "cpu_us_per_update": sum(cpu) * 1e6 / max(1, beacon.counters["programmed"]),
+        "adverts_on_air": radio.air_count,
+        "ha_signals": len(decoded),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--modes", default="fixed,event,adaptive")
+    ap.add_argument("--duration", type=float, default=15.0, help="seconds per mode")
+    ap.add_argument("--interval", type=int, default=2, help="plugin interval_s (scaled down from 20)")
+    ap.add_argument("--min-update", type=float, default=0.1, help="plugin min_update_s")
+    ap.add_argument("--change-every", type=float, default=1.5, help="mean seconds between stat changes")
+    ap.add_argument("--proxies", type=int, default=3)
+    ap.add_argument("--loss", type=float, default=0.1, help="per-proxy advert loss probability")
+    ap.add_argument("--jitter", type=float, default=0.05, help="max proxy delivery delay (s)")
+    ap.add_argument("--dup", type=float, default=0.05, help="probability a proxy delivers an advert twice")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    problems = check_tables()
+    for p in problems:
+        print(f"schema mismatch: {p}", file=sys.stderr)
+
+    results = [run_mode(m.strip(), args) for m in args.modes.split(",") if m.strip()]
+    if args.json:
+        print(json.dumps({"schema_problems": problems, "results": results}, indent=2))
+    else:
+        keys = list(results[0])
+        print(" ".join(f"{k:>18}" for k in keys))
+        for r in results:
+            print(" ".join(f"{r[k]:>18.2f}" if isinstance(r[k], float) else f"{str(r[k]):>18}" for k in keys))
+    ok = not problems and all(r["corrupt_states"] == 0 and r["final_state_ok"] for r in results)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
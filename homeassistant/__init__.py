@@ -1,17 +1,23 @@
 \
 from __future__ import annotations
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Set
 import logging
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.device_registry import DeviceInfo, CONNECTION_BLUETOOTH
 from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+from homeassistant.helpers.storage import Store
 from homeassistant.components.bluetooth import (
+    BluetoothCallbackMatcher,
+    BluetoothChange,
     BluetoothScanningMode,
     BluetoothServiceInfoBleak,
+    async_register_callback,
 )
 from homeassistant.components.bluetooth.passive_update_processor import (
     PassiveBluetoothDataUpdate,
@@ -20,106 +26,164 @@ from homeassistant.components.bluetooth.passive_update_processor import (
 
 from .const import (
     DOMAIN, MANUFACTURER_ID,
-    age_index_from_epochs, age_title_from_epochs,
-    strength_title_from_train, traveler_title_from_xp,
-    FACE_ID_TO_FACE, FACE_ID_TO_MOOD,
+    STALE_CHECK_INTERVAL, ONLINE_KEY,
+    MAX_UNCONFIGURED_DEVICES, UNCONFIGURED_TTL,
+    CONF_FLEET, MAX_FLEET_DEVICES, MAX_FLEET_REJECTED,
+    STORAGE_VERSION, STORAGE_SAVE_DELAY,
 )
+from .frames import KIND_CORE, frame_kind, schema_for
+from .processor import AdvertProcessor, _parse_payload  # noqa: F401
+from .state import PresenceTracker, PwnagotchiState, StateStore
 
 _LOGGER = logging.getLogger(__name__)
-PLATFORMS: list[Platform] = [Platform.SENSOR]
-LAST_VALUES: Dict[str, Dict[str, Any]] = {}
+PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.BINARY_SENSOR]
+DATA_PRESENCE = f"{DOMAIN}_presence"
+SIGNAL_OFFLINE = f"{DOMAIN}_offline"  # some device went stale (fleet aggregates recount)
+_FLEET_KEYS = frozenset({"handshakes", ONLINE_KEY})
 
 def _sig(address: str) -> str:
     return f"{DOMAIN}_adv_{address}"
 
+def _sig_new(entry_id: str) -> str:
+    """Fleet entry saw an address for the first time; platforms add its entities."""
+    return f"{DOMAIN}_new_{entry_id}"
+
+def _sig_fleet(entry_id: str) -> str:
+    return f"{DOMAIN}_fleet_{entry_id}"
+
+def _device_name(states: StateStore, address: str) -> str:
+    state = states.get(address)
+    device = state.device_info if state is not None else None
+    return (device or {}).get("name") or "Pwnagotchi"
+
+def _store(hass: HomeAssistant, entry: ConfigEntry) -> Store[Dict[str, Any]]:
+    return Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}")
+
 def _mk_update(*, address: str, device_info: DeviceInfo | None = None) -> PassiveBluetoothDataUpdate:
     devices: Dict[str, DeviceInfo] = {}
     if device_info:
         devices[address] = device_info
     return PassiveBluetoothDataUpdate(devices=devices, entity_descriptions={}, entity_data={}, entity_names={})
 
-def _parse_payload(mfr: bytes) -> Dict[str, Any]:
-    out: Dict[str, Any] = {}
-    if not mfr or len(mfr) < 2:
-        return out
-    ver = mfr[0]
-    body = mfr[1:]
-    try:
-        # v6: +face_id (1B) +face_rev (1B)
-        if ver >= 6 and len(body) >= 13:
-            hs  = int.from_bytes(body[0:2],  'little')
-            pts = int.from_bytes(body[2:4],  'little')
-            ep  = int.from_bytes(body[4:6],  'little')
-            cpu = body[6] / 2.0
-            trav= int.from_bytes(body[7:9],  'little')
-            tr  = int.from_bytes(body[9:11], 'little')
-            face_id = body[11]
-            # face_rev = body[12]  # currently unused, reserved for migrations
-            out.update({
-                "handshakes": hs,
-                "points": pts,
-                "epochs": ep,
-                "cpu_temp": cpu,
-                "traveler_xp": trav,
-                "train_epochs": tr,
-            })
-            out["age_index"] = age_index_from_epochs(ep)
-            out["age_title"] = age_title_from_epochs(ep)
-            out["strength_title"] = strength_title_from_train(tr)
-            out["traveler_title"] = traveler_title_from_xp(trav)
-            if face_id:
-                out["face"] = FACE_ID_TO_FACE.get(face_id, "unknown")
-                out["mood"] = FACE_ID_TO_MOOD.get(face_id, "unknown")
-            return out
-
-        # v5 compact (no face)
-        if ver >= 5 and len(body) >= 11:
-            hs  = int.from_bytes(body[0:2],  'little')
-            pts = int.from_bytes(body[2:4],  'little')
-            ep  = int.from_bytes(body[4:6],  'little')
-            cpu = body[6] / 2.0
-            trav= int.from_bytes(body[7:9],  'little')
-            tr  = int.from_bytes(body[9:11], 'little')
-            out.update({
-                "handshakes": hs,
-                "points": pts,
-                "epochs": ep,
-                "cpu_temp": cpu,
-                "traveler_xp": trav,
-                "train_epochs": tr,
-            })
-            out["age_index"] = age_index_from_epochs(ep)
-            out["age_title"] = age_title_from_epochs(ep)
-            out["strength_title"] = strength_title_from_train(tr)
-            out["traveler_title"] = traveler_title_from_xp(trav)
-            return out
-
-        # v3 legacy (we ignore built-in indexes)
-        if ver >= 3 and len(body) >= 15:
-            hs  = int.from_bytes(body[0:2],  'little')
-            pts = int.from_bytes(body[2:4],  'little')
-            ep  = int.from_bytes(body[4:6],  'little')
-            cpu = body[6] / 2.0
-            trav = int.from_bytes(body[11:13], 'little') if len(body) >= 13 else 0
-            tr   = int.from_bytes(body[13:15], 'little') if len(body) >= 15 else 0
-            out.update({
-                "handshakes": hs,
-                "points": pts,
-                "epochs": ep,
-                "cpu_temp": cpu,
-                "traveler_xp": trav,
-                "train_epochs": tr,
-            })
-            out["age_index"] = age_index_from_epochs(ep)
-            out["age_title"] = age_title_from_epochs(ep)
-            out["strength_title"] = strength_title_from_train(tr)
-            out["traveler_title"] = traveler_title_from_xp(trav)
-    except Exception as e:
-        _LOGGER.debug("Failed to parse payload: %s", e)
-    return out
+@callback
+def _async_presence(hass: HomeAssistant) -> Dict[str, Any]:
+    """The integration-wide presence tracker and its single staleness timer."""
+    data = hass.data.get(DATA_PRESENCE)
+    if data is None:
+        tracker = PresenceTracker()
+
+        @callback
+        def _tick(_now: datetime) -> None:
+            gone = tracker.expire(time.monotonic())
+            for state in gone:
+                async_dispatcher_send(hass, _sig(state.address), {ONLINE_KEY})
+            if gone:
+                async_dispatcher_send(hass, SIGNAL_OFFLINE)
+
+        data = hass.data[DATA_PRESENCE] = {
+            "tracker": tracker,
+            "cancel": async_track_time_interval(hass, _tick, timedelta(seconds=STALE_CHECK_INTERVAL)),
+            "entries": set(),
+        }
+    return data
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    address_hint: str = entry.data.get("address") or (entry.unique_id or "")
+    fleet = bool(entry.data.get(CONF_FLEET))
+    address_hint: str = "" if fleet else entry.data.get("address") or (entry.unique_id or "")
+
+    states = StateStore(
+        pinned=[address_hint],
+        max_unpinned=MAX_FLEET_DEVICES if fleet else MAX_UNCONFIGURED_DEVICES,
+        ttl=UNCONFIGURED_TTL,
+    )
+
+    presence = _async_presence(hass)
+    presence["entries"].add(entry.entry_id)
+    tracker: PresenceTracker = presence["tracker"]
+
+    def _device_info(state: PwnagotchiState, name: str) -> DeviceInfo:
+        device = state.device_info
+        if device is None or device.get("name") != name:
+            device = state.device_info = DeviceInfo(
+                identifiers={(DOMAIN, state.address)},
+                connections={(CONNECTION_BLUETOOTH, state.address)},
+                name=name,
+                manufacturer="Pwnagotchi",
+                model="BLE Beacon",
+            )
+        return device
+
+    @callback
+    def _send(address: str, changed: Set[str]) -> None:
+        async_dispatcher_send(hass, _sig(address), changed)
+        if fleet and not _FLEET_KEYS.isdisjoint(changed):
+            async_dispatcher_send(hass, _sig_fleet(entry.entry_id))
+
+    @callback
+    def _call_later(delay: float, action: Callable[..., None]) -> Callable[[], None]:
+        return async_call_later(hass, delay, callback(action))
+
+    # debounced persistence: one delayed write is armed by the first advert (duplicates too,
+    # they still move last_seen) and serialises whatever the states hold when it fires
+    # (HA also flushes it on shutdown)
+    store = _store(hass, entry)
+    save_armed = False
+
+    def _dump() -> Dict[str, Any]:
+        nonlocal save_armed
+        save_armed = False
+        return states.dump()
+
+    @callback
+    def _schedule_save() -> None:
+        nonlocal save_armed
+        if not save_armed:
+            save_armed = True
+            store.async_delay_save(_dump, STORAGE_SAVE_DELAY)
+
+    processor = AdvertProcessor(
+        states, tracker, _send, _call_later, options=lambda: entry.options, on_seen=_schedule_save,
+    )
+    stored = await store.async_load() or {}
+    for address, item in (stored.get("devices") or {}).items():
+        processor.restore(address, item)
+
+    # fleet mode: a single callback on the manufacturer id, demultiplexed by address;
+    # entities for an address are created the first time it is seen
+    known: Set[str] = {state.address for state in states}  # restored ones get entities at platform setup
+    if fleet:
+        # an address with entities is pinned: TTL/LRU eviction would blank its sensors,
+        # drop it from the store and make the fleet total dip and climb back
+        states.pinned.update(known)
+    ignored: Set[str] = set()  # addresses that have their own config entry
+    rejected: Dict[str, bytes] = {}  # unadopted address -> last payload that failed the frame check
+
+    @callback
+    def _fleet_adv(service_info: BluetoothServiceInfoBleak, _change: BluetoothChange) -> None:
+        mfr = (service_info.manufacturer_data or {}).get(MANUFACTURER_ID)
+        address = service_info.address
+        if not mfr or address in ignored:
+            return
+        if address not in known:
+            if rejected.get(address) == mfr:
+                return
+            # 0xFFFF is the reserved test id that plenty of other gear uses: only adopt an
+            # address (state and entities) once it sends a core frame we can decode
+            if frame_kind(mfr[0]) != KIND_CORE or schema_for(mfr) is None or not _parse_payload(mfr):
+                if len(rejected) >= MAX_FLEET_REJECTED:
+                    rejected.clear()
+                rejected[address] = bytes(mfr)
+                return
+            rejected.pop(address, None)
+            if any(e.unique_id == address for e in hass.config_entries.async_entries(DOMAIN) if e is not entry):
+                ignored.add(address)
+                return
+        state = processor.process(address, mfr, service_info.rssi)
+        if address not in known:
+            known.add(address)
+            states.pinned.add(address)
+            _device_info(state, service_info.name or "Pwnagotchi")
+            async_dispatcher_send(hass, _sig_new(entry.entry_id), address)
 
     def _update_from_adv(service_info: BluetoothServiceInfoBleak) -> PassiveBluetoothDataUpdate:
         address = service_info.address or address_hint or "pwnagotchi"
@@ -128,27 +192,10 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         if not mfr:
             return PassiveBluetoothDataUpdate(devices={}, entity_descriptions={}, entity_data={}, entity_names={})
 
-        device = DeviceInfo(
-            identifiers={(DOMAIN, address)},
-            connections={(CONNECTION_BLUETOOTH, address)},
-            name=name,
-            manufacturer="Pwnagotchi",
-            model="BLE Beacon",
-        )
-
-        now_dt = datetime.now(timezone.utc)
-        bucket = LAST_VALUES.setdefault(address, {})
-        bucket["rssi"] = service_info.rssi
-        bucket["last_seen"] = now_dt
-        bucket["payload_hex"] = mfr.hex()
+        state = processor.process(address, mfr, service_info.rssi)
+        return _mk_update(address=address, device_info=_device_info(state, name))
 
-        stats = _parse_payload(bytes(mfr))
-        bucket.update(stats)
-
-        async_dispatcher_send(hass, _sig(address))
-        return _mk_update(address=address, device_info=device)
-
-    coordinator = PassiveBluetoothProcessorCoordinator(
+    coordinator = None if fleet else PassiveBluetoothProcessorCoordinator(
         hass,
         _LOGGER,
         address=address_hint,
@@ -159,15 +206,39 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = {
         "coordinator": coordinator,
+        "fleet": fleet,
         "address": address_hint,
+        "states": states,
+        "processor": processor,
+        "store": store,
     }
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
-    entry.async_on_unload(coordinator.async_start())
+    if coordinator is not None:
+        entry.async_on_unload(coordinator.async_start())
+    else:
+        entry.async_on_unload(async_register_callback(
+            hass,
+            _fleet_adv,
+            BluetoothCallbackMatcher(manufacturer_id=MANUFACTURER_ID, connectable=False),
+            BluetoothScanningMode.PASSIVE,
+        ))
     return True
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data.get(DOMAIN, {}).pop(entry.entry_id, None)
+        data = hass.data.get(DOMAIN, {}).pop(entry.entry_id, None)
+        if data:
+            await data["store"].async_save(data["states"].dump())
+            data["states"].clear()
+        presence = hass.data.get(DATA_PRESENCE)
+        if presence:
+            presence["entries"].discard(entry.entry_id)
+            if not presence["entries"]:
+                presence["cancel"]()
+                hass.data.pop(DATA_PRESENCE, None)
     return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await _store(hass, entry).async_remove()
@@ -1 +1,62 @@
-# intentionally empty; no binary sensors
+\
+from __future__ import annotations
+from typing import Set
+from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySensorDeviceClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.device_registry import DeviceInfo, CONNECTION_BLUETOOTH
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from .const import DOMAIN, ONLINE_KEY
+from . import _device_name, _sig, _sig_new  # type: ignore[attr-defined]
+from .state import StateStore
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities) -> None:
+    data = hass.data[DOMAIN][entry.entry_id]
+    states: StateStore = data["states"]
+    if data.get("fleet"):
+        @callback
+        def _add_device(address: str) -> None:
+            async_add_entities([PwnagotchiPresence(states, address, _device_name(states, address))])
+
+        entry.async_on_unload(async_dispatcher_connect(hass, _sig_new(entry.entry_id), _add_device))
+        for state in states:
+            _add_device(state.address)
+        return
+    address: str = data.get("address") or entry.unique_id or "pwnagotchi"
+    async_add_entities([PwnagotchiPresence(states, address)])
+
+class PwnagotchiPresence(BinarySensorEntity):
+    """On while adverts keep arriving; flips off once the device goes stale."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_device_class = BinarySensorDeviceClass.PRESENCE
+    _attr_icon = "mdi:bluetooth-connect"
+
+    def __init__(self, states: StateStore, address: str, device_name: str = "Pwnagotchi") -> None:
+        self._states = states
+        self._address = address
+        base = address or "pwnagotchi"
+        self._attr_unique_id = f"{base}|presence"
+        self._attr_name = "Pwnagotchi Presence"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, base)},
+            connections={(CONNECTION_BLUETOOTH, base)},
+            manufacturer="Pwnagotchi",
+            model="BLE Beacon",
+            name=device_name,
+        )
+
+    @property
+    def is_on(self) -> bool:
+        state = self._states.get(self._address)
+        return state is not None and state.online
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(async_dispatcher_connect(self.hass, _sig(self._address), self._handle_update))
+
+    @callback
+    def _handle_update(self, changed: Set[str] | None = None) -> None:
+        if changed is None or ONLINE_KEY in changed:
+            self.async_write_ha_state()
@@ -1,8 +1,16 @@
 from __future__ import annotations
 
+import voluptuous as vol
+
 from homeassistant import config_entries
 from homeassistant.components.bluetooth import BluetoothServiceInfoBleak
-from .const import DOMAIN
+from homeassistant.core import callback
+from .const import (
+    DOMAIN, CONF_FLEET, FLEET_UNIQUE_ID,
+    CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL,
+    CONF_STALE_AFTER, DEFAULT_STALE_AFTER,
+    CONF_RECONSTRUCT_TOTALS, DEFAULT_RECONSTRUCT_TOTALS,
+)
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
@@ -10,5 +18,43 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     async def async_step_bluetooth(self, discovery_info: BluetoothServiceInfoBleak):
         await self.async_set_unique_id(discovery_info.address)
         self._abort_if_unique_id_configured()
+        # a fleet entry already serves every beacon
+        if any(e.data.get(CONF_FLEET) for e in self._async_current_entries()):
+            return self.async_abort(reason="already_configured")
         title = discovery_info.name or "Pwnagotchi"
         return self.async_create_entry(title=title, data={"address": discovery_info.address})
+
+    async def async_step_user(self, user_input=None):
+        """Fleet entry: one callback for every beacon, devices added as they show up."""
+        await self.async_set_unique_id(FLEET_UNIQUE_ID)
+        self._abort_if_unique_id_configured()
+        if user_input is not None:
+            return self.async_create_entry(title="Pwnagotchi fleet", data={CONF_FLEET: True})
+        return self.async_show_form(step_id="user", data_schema=vol.Schema({}))
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> config_entries.OptionsFlow:
+        return OptionsFlowHandler()
+
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    # self.config_entry is provided by the flow manager
+    async def async_step_init(self, user_input=None):
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+        options = self.config_entry.options
+        schema = vol.Schema({
+            vol.Optional(
+                CONF_MIN_PUBLISH_INTERVAL,
+                default=options.get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL),
+            ): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+            vol.Optional(
+                CONF_STALE_AFTER,
+                default=options.get(CONF_STALE_AFTER, DEFAULT_STALE_AFTER),
+            ): vol.All(vol.Coerce(float), vol.Range(min=30, max=86400)),
+            vol.Optional(
+                CONF_RECONSTRUCT_TOTALS,
+                default=options.get(CONF_RECONSTRUCT_TOTALS, DEFAULT_RECONSTRUCT_TOTALS),
+            ): bool,
+        })
+        return self.async_show_form(step_id="init", data_schema=schema)
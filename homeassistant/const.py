@@ -1,10 +1,44 @@
 \
 from __future__ import annotations
-from typing import Dict, List, Tuple
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple, Union
 
 DOMAIN = "pwnagotchi_ble"
 MANUFACTURER_ID = 0xFFFF
 
+# === Options ===
+CONF_MIN_PUBLISH_INTERVAL = "min_publish_interval"  # seconds, 0 = publish every change
+DEFAULT_MIN_PUBLISH_INTERVAL = 0
+
+CONF_RECONSTRUCT_TOTALS = "reconstruct_totals"  # rebuild full totals from wrapping v5/v6 counters
+DEFAULT_RECONSTRUCT_TOTALS = False
+
+CONF_STALE_AFTER = "stale_after"  # seconds without adverts before a device is unavailable
+DEFAULT_STALE_AFTER = 300
+STALE_CHECK_INTERVAL = 10  # seconds, one shared timer for the whole integration
+
+RATE_REFRESH_INTERVAL = 60  # seconds; rate sensors also decay while the payload is static
+
+# Last payloads are persisted in .storage/<DOMAIN>.<entry_id> and restored on startup
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 60  # seconds; at most one write per delay, only while adverts arrive
+
+# Key sent in the changed set when a device goes online/offline
+ONLINE_KEY = "online"
+
+# Addresses seen by an entry that are not its configured address are capped
+MAX_UNCONFIGURED_DEVICES = 64
+UNCONFIGURED_TTL = 3600  # seconds
+
+# Fleet entry: one manufacturer-id callback for every beacon in range
+CONF_FLEET = "fleet"
+FLEET_UNIQUE_ID = "fleet"
+MAX_FLEET_DEVICES = 512
+# addresses whose last 0xFFFF payload was not a decodable core frame; checked again
+# only when that payload changes (the cache is cleared when full)
+MAX_FLEET_REJECTED = 1024
+
 # === Title tables (as in your plugins) ===
 
 DEFAULT_AGE_TITLES: Dict[int, str] = {
@@ -122,35 +156,60 @@ FACE_ID_TO_MOOD: Dict[int, str] = {
 # Reverse lookup helper
 FACE_STR_TO_ID: Dict[str, int] = {v: k for k, v in FACE_ID_TO_FACE.items()}
 
-def _sorted_thresholds(d: Dict[int, str]) -> List[Tuple[int, str]]:
-    return sorted(d.items(), key=lambda kv: kv[0])
-
-def title_for_value(value: int, table: Dict[int, str]) -> str:
-    last = next(iter(table.values()))
-    for thr, name in _sorted_thresholds(table):
-        if value >= thr:
-            last = name
-        else:
-            break
-    return last
-
-def index_for_value(value: int, table: Dict[int, str]) -> int:
-    idx = 0
-    for thr, _ in _sorted_thresholds(table):
-        if value >= thr:
-            idx += 1
-        else:
-            break
-    return idx
+# Fixed options of the enum sensors (every value _parse_payload can produce)
+UNKNOWN = "unknown"
+AGE_TITLE_OPTIONS: List[str] = list(dict.fromkeys(DEFAULT_AGE_TITLES.values()))
+STRENGTH_TITLE_OPTIONS: List[str] = list(dict.fromkeys(DEFAULT_STRENGTH_TITLES.values()))
+TRAVELER_TITLE_OPTIONS: List[str] = list(dict.fromkeys(TRAVEL_TITLES.values()))
+FACE_OPTIONS: List[str] = list(dict.fromkeys(FACE_ID_TO_FACE.values())) + [UNKNOWN]
+MOOD_OPTIONS: List[str] = list(dict.fromkeys(FACE_ID_TO_MOOD.values())) + [UNKNOWN]
+
+# Last Seen is reported to the minute so the recorder stores at most one row a minute
+LAST_SEEN_RESOLUTION = 60  # seconds
+
+# === Title lookup ===
+# The three title tables are sorted once at import; lookups are a bisect. Values below
+# the lowest threshold get the table's first entry.
+
+class TitleTable(NamedTuple):
+    thresholds: Tuple[int, ...]
+    titles: Tuple[str, ...]
+    first: str
+
+def compile_titles(table: Dict[int, str]) -> TitleTable:
+    thresholds = tuple(sorted(table))
+    return TitleTable(thresholds, tuple(table[t] for t in thresholds), next(iter(table.values())))
+
+AGE_TITLE_TABLE = compile_titles(DEFAULT_AGE_TITLES)
+STRENGTH_TITLE_TABLE = compile_titles(DEFAULT_STRENGTH_TITLES)
+TRAVEL_TITLE_TABLE = compile_titles(TRAVEL_TITLES)
+
+def _as_title_table(table: Union[TitleTable, Dict[int, str]]) -> TitleTable:
+    # other tables are compiled per call, nothing is cached for them
+    return table if isinstance(table, TitleTable) else compile_titles(table)
+
+def title_for_value(value: int, table: Union[TitleTable, Dict[int, str]]) -> str:
+    thresholds, titles, first = _as_title_table(table)
+    idx = bisect_right(thresholds, value)
+    return titles[idx - 1] if idx else first
+
+def index_for_value(value: int, table: Union[TitleTable, Dict[int, str]]) -> int:
+    return bisect_right(_as_title_table(table).thresholds, value)
+
+# Epochs and train epochs rarely move between adverts, so memoize on the raw value.
 
+@lru_cache(maxsize=256)
 def age_index_from_epochs(epochs: int) -> int:
-    return index_for_value(int(epochs), DEFAULT_AGE_TITLES)
+    return index_for_value(int(epochs), AGE_TITLE_TABLE)
 
+@lru_cache(maxsize=256)
 def age_title_from_epochs(epochs: int) -> str:
-    return title_for_value(int(epochs), DEFAULT_AGE_TITLES)
+    return title_for_value(int(epochs), AGE_TITLE_TABLE)
 
+@lru_cache(maxsize=256)
 def strength_title_from_train(train_epochs: int) -> str:
-    return title_for_value(int(train_epochs), DEFAULT_STRENGTH_TITLES)
+    return title_for_value(int(train_epochs), STRENGTH_TITLE_TABLE)
 
+@lru_cache(maxsize=256)
 def traveler_title_from_xp(xp: int) -> str:
-    return title_for_value(int(xp), TRAVEL_TITLES)
+    return title_for_value(int(xp), TRAVEL_TITLE_TABLE)
@@ -0,0 +1,17 @@
+\
+from __future__ import annotations
+from typing import Any, Dict
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    data = hass.data.get(DOMAIN, {}).get(entry.entry_id) or {}
+    states = data.get("states")
+    return {
+        "address": data.get("address"),
+        "options": dict(entry.options),
+        "devices": {state.address: state.diagnostics() for state in states} if states is not None else {},
+    }
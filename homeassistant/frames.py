@@ -0,0 +1,107 @@
+\
+from __future__ import annotations
+import struct
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+# === Frame schema registry ===
+# One entry per manufacturer-payload version. Keep in sync with FRAME_SCHEMAS in the plugin.
+# Each field is (key, divisor); divisor != 1 turns the raw integer into a float (cpu_temp is
+# sent x2, load x100). Dividing by an integer keeps 57 / 100 == 0.57, where 57 * 0.01 would not.
+# Padding bytes are expressed as "x" in the struct format and have no field entry.
+# ``varints`` are unsigned LEB128 integers following the fixed part.
+# The high nibble of the version byte is the frame kind; a beacon may rotate between
+# kinds (or put one in the scan response) and the integration merges them per address.
+
+KIND_CORE = 0x00     # counters, temperature, face
+KIND_HEALTH = 0x10   # battery, uptime, load, memory
+KIND_SESSION = 0x20  # counters since the plugin was loaded
+
+def frame_kind(version: int) -> int:
+    return version & 0xF0
+
+class FrameSchema(NamedTuple):
+    version: int
+    codec: struct.Struct
+    fields: Tuple[Tuple[str, int], ...]
+    varints: Tuple[str, ...] = ()
+
+    @property
+    def min_size(self) -> int:
+        return self.codec.size + len(self.varints)
+
+FRAME_SCHEMAS: Dict[int, FrameSchema] = {}
+
+# Counters that v7 carries as varints; v5/v6 carry them as uint16
+WIDE_COUNTERS: Tuple[str, ...] = ("handshakes", "points", "epochs", "traveler_xp", "train_epochs")
+
+def register_frame(
+    version: int, fmt: str, fields: Tuple[Tuple[str, int], ...], varints: Tuple[str, ...] = ()
+) -> FrameSchema:
+    schema = FrameSchema(version, struct.Struct(fmt), tuple(fields), tuple(varints))
+    FRAME_SCHEMAS[version] = schema
+    return schema
+
+_COUNTERS: Tuple[Tuple[str, int], ...] = (
+    ("handshakes", 1),
+    ("points", 1),
+    ("epochs", 1),
+    ("cpu_temp", 2),
+)
+
+# v3 legacy: battery, flags and the built-in age/strength indexes (4 bytes) are skipped
+register_frame(3, "<BHHHB4xHH", _COUNTERS + (("traveler_xp", 1), ("train_epochs", 1)))
+# v5 compact (no face)
+register_frame(5, "<BHHHBHH", _COUNTERS + (("traveler_xp", 1), ("train_epochs", 1)))
+# v6: +face_id (1B) +face_rev (1B, reserved for migrations)
+register_frame(6, "<BHHHBHHBB", _COUNTERS + (("traveler_xp", 1), ("train_epochs", 1), ("face_id", 1), ("face_rev", 1)))
+# v7: wide counters as varints after cpu*2, face_id, face_rev (fits the 24-byte payload budget)
+register_frame(7, "<BBBB", (("cpu_temp", 2), ("face_id", 1), ("face_rev", 1)), varints=WIDE_COUNTERS)
+# health: battery % (255 = no battery), uptime s, load1 x100, memory %
+register_frame(KIND_HEALTH, "<BBIHB", (("battery", 1), ("uptime", 1), ("cpu_load", 100), ("mem_usage", 1)))
+# session: version byte only, then the counters as varints
+register_frame(KIND_SESSION, "<B", (), varints=(
+    "session_epochs", "session_handshakes", "session_deauths", "session_associations", "session_missed",
+))
+
+def schema_for(mfr: bytes) -> Optional[FrameSchema]:
+    """Exact version match first; unknown newer versions fall back to the newest
+    older schema of the same kind whose layout fits, so a v6 decoder still reads
+    the v6 prefix of a v6.x frame."""
+    if not mfr:
+        return None
+    ver = mfr[0]
+    schema = FRAME_SCHEMAS.get(ver)
+    if schema is not None and len(mfr) >= schema.min_size:
+        return schema
+    kind = frame_kind(ver)
+    for v in sorted(FRAME_SCHEMAS, reverse=True):
+        cand = FRAME_SCHEMAS[v]
+        if v <= ver and frame_kind(v) == kind and len(mfr) >= cand.min_size:
+            return cand
+    return None
+
+def decode_frame(mfr: bytes) -> Dict[str, Any]:
+    """Decode the raw fields of a manufacturer payload with a single unpack_from."""
+    schema = schema_for(mfr)
+    if schema is None:
+        return {}
+    view = memoryview(mfr)
+    values = schema.codec.unpack_from(view, 0)
+    out: Dict[str, Any] = {}
+    for (key, div), raw in zip(schema.fields, values[1:]):
+        out[key] = raw / div if div != 1 else raw
+    pos = schema.codec.size
+    end = len(view)
+    for key in schema.varints:
+        value = shift = 0
+        while True:
+            if pos >= end or shift > 63:
+                return {}  # truncated or malformed varint
+            b = view[pos]
+            pos += 1
+            value |= (b & 0x7F) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        out[key] = value
+    return out
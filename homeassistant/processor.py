@@ -0,0 +1,189 @@
+\
+from __future__ import annotations
+from typing import Any, Callable, Dict, Mapping, Optional, Set
+import logging
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from .const import (
+    CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL,
+    CONF_STALE_AFTER, DEFAULT_STALE_AFTER, ONLINE_KEY, RATE_REFRESH_INTERVAL,
+    CONF_RECONSTRUCT_TOTALS, DEFAULT_RECONSTRUCT_TOTALS, LAST_SEEN_RESOLUTION,
+)
+from .frames import KIND_CORE, WIDE_COUNTERS, decode_frame, frame_kind
+from .rates import CounterTotals
+from .state import DIAG_FIELDS, PresenceTracker, PwnagotchiState, StateStore
+
+_LOGGER = logging.getLogger(__name__)
+
+# send(address, changed_keys) and call_later(delay, fn) -> cancel
+BATTERY_UNKNOWN = 0xFF  # health frame from a beacon without a battery
+
+SendFn = Callable[[str, Set[str]], None]
+CallLaterFn = Callable[[float, Callable[..., None]], Callable[[], None]]
+
+def _parse_payload(mfr: bytes, totals: Optional[CounterTotals] = None) -> Dict[str, Any]:
+    """Decode a payload. With ``totals``, 16-bit counters from v5/v6 frames are widened
+    into running totals (and v7 frames, which are already wide, reset the baseline).
+    Health and session frames only carry their own fields. Only raw numbers are
+    returned; titles, face and mood are derived on read (see state.DERIVED_FIELDS)."""
+    out: Dict[str, Any] = {}
+    if not mfr or len(mfr) < 2:
+        return out
+    try:
+        out = decode_frame(mfr)
+        if not out:
+            return out
+        if frame_kind(mfr[0]) != KIND_CORE:
+            if out.get("battery") == BATTERY_UNKNOWN:
+                out["battery"] = None
+            return out
+        if totals is not None:
+            if mfr[0] >= 7:
+                totals.adopt(out, WIDE_COUNTERS)
+            else:
+                totals.widen(out, WIDE_COUNTERS)
+        out.pop("face_rev", None)  # currently unused, reserved for migrations
+        if not out.get("face_id", 1):
+            del out["face_id"]  # 0 = face not broadcast; keep the last known one
+    except Exception as e:
+        _LOGGER.debug("Failed to parse payload: %s", e)
+    return out
+
+class AdvertProcessor:
+    """Decode and fan-out path behind each config entry's _update_from_adv.
+
+    Holds no Home Assistant objects: the dispatcher and timer are passed in as
+    ``send`` and ``call_later``, so the same code runs under the replay benchmark.
+    ``on_seen`` is called after every advert, deduped or not, since each one moves
+    last_seen (the entry uses it to arm a debounced save of the stored state).
+    """
+
+    def __init__(
+        self,
+        states: StateStore,
+        tracker: PresenceTracker,
+        send: SendFn,
+        call_later: CallLaterFn,
+        options: Callable[[], Mapping[str, Any]] = dict,
+        clock: Callable[[], float] = time.monotonic,
+        on_seen: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.states = states
+        self.tracker = tracker
+        self._send = send
+        self._call_later = call_later
+        self._options = options
+        self._clock = clock
+        self._on_seen = on_seen
+
+    def process(self, address: str, mfr: bytes, rssi: Optional[int]) -> PwnagotchiState:
+        now = self._clock()
+        state = self.states.touch(address, now)
+        state.adverts_received += 1
+        state.rssi = rssi
+        state.last_seen = datetime.now(timezone.utc)
+        seen_slot = int(state.last_seen.timestamp()) // LAST_SEEN_RESOLUTION
+        stale_after = float(self._options().get(CONF_STALE_AFTER, DEFAULT_STALE_AFTER))
+        came_online = self.tracker.seen(state, now, stale_after)
+
+        # fast path: identical payload (another proxy, or nothing changed) -> no parse, no fan-out.
+        # Compared per frame kind, so a beacon rotating core/health/session frames still dedupes.
+        raw = bytes(mfr)
+        kind = frame_kind(raw[0]) if raw else KIND_CORE
+        if state.frames.get(kind) == raw:
+            state.adverts_deduped += 1
+            changed = {ONLINE_KEY} if came_online else set()
+            if seen_slot != state.last_seen_slot:
+                # the Last Seen sensor only shows LAST_SEEN_RESOLUTION steps
+                state.last_seen_slot = seen_slot
+                changed.add("last_seen")
+            if now - state.rates_at >= RATE_REFRESH_INTERVAL:
+                changed |= state.refresh_rates(now)
+            if changed:
+                self.publish(state, changed)
+            if self._on_seen is not None:
+                self._on_seen()
+            return state
+        state.raw = state.frames[kind] = raw
+
+        totals = None
+        if self._options().get(CONF_RECONSTRUCT_TOTALS, DEFAULT_RECONSTRUCT_TOTALS):
+            totals = state.totals
+            if totals is None:
+                totals = state.totals = CounterTotals()
+        t0 = time.perf_counter()
+        stats = _parse_payload(raw, totals)
+        state.record_decode(now, raw[0] if raw else 0, time.perf_counter() - t0, bool(stats))
+
+        changed = state.apply(stats)
+        if changed:
+            state.sample_rates(now)
+        changed |= state.refresh_rates(now)
+        changed |= {"last_seen", "payload_hex"}
+        state.last_seen_slot = seen_slot
+        changed.update(DIAG_FIELDS)
+        if came_online:
+            changed.add(ONLINE_KEY)
+
+        # entities only write state when their key is in the changed set
+        self.publish(state, changed)
+        if self._on_seen is not None:
+            self._on_seen()
+        return state
+
+    def restore(self, address: str, stored: Mapping[str, Any], wall_now: Optional[datetime] = None) -> Optional[PwnagotchiState]:
+        """Rehydrate a device from StateStore.dump() output, decoding each stored frame once.
+
+        Restored frames do not count as adverts (no diagnostics, rates or publish). The
+        device is online only if its last_seen is still inside the stale_after window, and
+        then goes offline at the same moment it would have without the restart.
+        """
+        try:
+            frames = [bytes.fromhex(h) for h in stored.get("frames") or ()]
+            last_seen = datetime.fromisoformat(stored["last_seen"]) if stored.get("last_seen") else None
+            totals = CounterTotals.from_dict(stored["totals"]) if stored.get("totals") else None
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            _LOGGER.debug("Ignoring stored state for %s: %s", address, e)
+            return None
+        frames = [raw for raw in frames if raw]
+        if not frames:
+            return None
+        now = self._clock()
+        state = self.states.touch(address, now)
+        state.totals = totals
+        for raw in frames:
+            state.apply(_parse_payload(raw, totals))
+            state.frames[frame_kind(raw[0])] = raw
+        state.raw = state.frames.get(KIND_CORE, frames[-1])
+        state.rssi = stored.get("rssi")
+        state.last_seen = last_seen
+        if last_seen is not None:
+            age = ((wall_now or datetime.now(timezone.utc)) - last_seen).total_seconds()
+            stale_after = float(self._options().get(CONF_STALE_AFTER, DEFAULT_STALE_AFTER))
+            if 0 <= age < stale_after:
+                self.tracker.seen(state, now - age, stale_after)
+        return state
+
+    # publish throttling: changes inside min_publish_interval are merged into one
+    # trailing signal per device (one timer per address, not per entity)
+    def publish(self, state: PwnagotchiState, changed: Set[str]) -> None:
+        if state.cancel_publish is not None:
+            state.pending |= changed
+            return
+        interval = float(self._options().get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL) or 0)
+        wait = state.published_at + interval - self._clock()
+        if wait <= 0:
+            state.published_at = self._clock()
+            self._send(state.address, changed)
+            return
+        state.pending = set(changed)
+        state.cancel_publish = self._call_later(wait, partial(self._flush, state))
+
+    def _flush(self, state: PwnagotchiState, _now: Any = None) -> None:
+        state.cancel_publish = None
+        changed, state.pending = state.pending, None
+        if changed:
+            state.published_at = self._clock()
+            self._send(state.address, changed)
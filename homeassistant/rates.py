@@ -0,0 +1,136 @@
+\
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional
+
+U16_MAX = 0xFFFF
+# A drop from within WRAP_SLACK of the top to within WRAP_SLACK of zero is a wrap. A
+# shorter step back that does not land near zero is a stale reading (a relay or proxy
+# replaying an older advert) and is ignored; any other drop is a counter reset (reboot,
+# new brain) and counts from zero.
+WRAP_SLACK = 0x1000
+
+def counter_delta(prev: int, new: int, bits: int = 16) -> Optional[int]:
+    """Increase of a monotonic counter between two readings, across wraps and resets.
+
+    Returns None for an out-of-order reading; the caller keeps ``prev`` as the last value.
+    """
+    if new >= prev:
+        return new - prev
+    top = (1 << bits) - 1
+    if top - WRAP_SLACK < prev <= top and new < WRAP_SLACK:
+        return (new - prev) & top
+    back = prev - new
+    if back < WRAP_SLACK and new >= back:
+        return None  # fell back less than it would have counted up from zero
+    return new
+
+class RateWindow:
+    """Sliding-window rate of a counter using a fixed ring of time buckets.
+
+    ``add`` folds the counter's increase into the current bucket and ``rate`` reads the
+    running sum; expired buckets are zeroed as time advances, so both are O(1)
+    amortized with constant memory. A 16-bit counter pinned at 65535 (the senders
+    clamp there) has no measurable rate and reports None.
+    """
+
+    __slots__ = ("width", "_slots", "_sum", "_head", "_head_idx", "_last", "_first_t", "saturated")
+
+    def __init__(self, window: float = 3600.0, buckets: int = 60) -> None:
+        self.width = float(window) / buckets
+        self._slots: List[int] = [0] * buckets
+        self._sum = 0
+        self._head = 0
+        self._head_idx: Optional[int] = None
+        self._last: Optional[int] = None
+        self._first_t: Optional[float] = None
+        self.saturated = False
+
+    def _advance(self, now: float) -> None:
+        idx = int(now // self.width)
+        if self._head_idx is None:
+            self._head_idx = idx
+            return
+        steps = idx - self._head_idx
+        if steps <= 0:
+            return
+        n = len(self._slots)
+        if steps >= n:
+            self._slots = [0] * n
+            self._sum = 0
+        else:
+            for _ in range(steps):
+                self._head = (self._head + 1) % n
+                self._sum -= self._slots[self._head]
+                self._slots[self._head] = 0
+        self._head_idx = idx
+
+    def add(self, now: float, value: int) -> None:
+        self._advance(now)
+        prev = self._last
+        if prev is None:
+            self._last = value
+            self._first_t = now
+            return
+        delta = counter_delta(prev, value)
+        if delta is None:
+            return  # stale reading: keep the previous one as the baseline
+        self._last = value
+        self.saturated = value == U16_MAX and prev == U16_MAX
+        self._slots[self._head] += delta
+        self._sum += delta
+
+    def rate(self, now: float) -> Optional[float]:
+        """Increase per hour over the window (or the time covered so far)."""
+        if self._first_t is None or self.saturated:
+            return None
+        self._advance(now)
+        covered = min(now - self._first_t, self.width * len(self._slots))
+        if covered < self.width:
+            return None
+        return round(self._sum * 3600.0 / covered, 2)
+
+class CounterTotals:
+    """Rebuilds unbounded totals from 16-bit counters sent by v5/v6 senders that wrap
+    (``wrap_counters``), by summing counter_delta between consecutive readings."""
+
+    __slots__ = ("last", "totals")
+
+    def __init__(self) -> None:
+        self.last: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {}
+
+    def widen(self, values: Dict[str, Any], keys: Iterable[str]) -> None:
+        """Replace the 16-bit readings in values by the running totals."""
+        for key in keys:
+            value = values.get(key)
+            if value is None:
+                continue
+            prev = self.last.get(key)
+            if prev is None:
+                total = value
+            else:
+                delta = counter_delta(prev, value)
+                if delta is None:
+                    values[key] = self.totals[key]  # stale reading: keep the total and last
+                    continue
+                total = self.totals[key] + delta
+            self.last[key] = value
+            self.totals[key] = values[key] = total
+
+    def adopt(self, values: Dict[str, Any], keys: Iterable[str]) -> None:
+        """Take totals from a frame that already carries full-width counters."""
+        for key in keys:
+            value = values.get(key)
+            if value is not None:
+                self.totals[key] = value
+                self.last[key] = value & U16_MAX
+
+    def as_dict(self) -> Dict[str, Dict[str, int]]:
+        return {"last": dict(self.last), "totals": dict(self.totals)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Dict[str, int]]) -> "CounterTotals":
+        out = cls()
+        out.last.update({k: int(v) for k, v in data.get("last", {}).items()})
+        out.totals.update({k: int(v) for k, v in data.get("totals", {}).items()})
+        return out
@@ -1,16 +1,21 @@
 \
 from __future__ import annotations
-from typing import Any, List, Dict
-from homeassistant.components.sensor import SensorEntity, SensorDeviceClass
-from homeassistant.const import UnitOfTemperature
+from datetime import datetime
+from typing import Any, List, Dict, Set
+from homeassistant.components.sensor import SensorEntity, SensorDeviceClass, SensorStateClass
+from homeassistant.const import PERCENTAGE, EntityCategory, UnitOfTemperature, UnitOfTime
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.device_registry import DeviceInfo, CONNECTION_BLUETOOTH
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
-from .const import DOMAIN
-from . import LAST_VALUES, _sig  # type: ignore[attr-defined]
+from .const import (
+    DOMAIN, ONLINE_KEY, LAST_SEEN_RESOLUTION,
+    AGE_TITLE_OPTIONS, STRENGTH_TITLE_OPTIONS, TRAVELER_TITLE_OPTIONS, FACE_OPTIONS, MOOD_OPTIONS,
+)
+from . import SIGNAL_OFFLINE, _device_name, _sig, _sig_fleet, _sig_new  # type: ignore[attr-defined]
+from .state import DIAG_FIELDS, RATE_FIELDS, StateStore
 
 _KEYS: List[str] = [
     "last_seen",
@@ -27,35 +32,93 @@ _KEYS: List[str] = [
     # new face sensors (if present)
     "face",
     "mood",
+    # derived per-hour rates
+    *RATE_FIELDS,
+    # health / session frames (only filled if the beacon rotates them in)
+    "battery",
+    "uptime",
+    "cpu_load",
+    "mem_usage",
+    "session_epochs",
+    "session_handshakes",
+    "session_deauths",
+    "session_associations",
+    "session_missed",
 ]
 
+# decode-path diagnostics, disabled by default
+_DIAG_KEYS: List[str] = list(DIAG_FIELDS)
+
+# state_class lets the recorder keep 5-minute/hourly statistics instead of raw history:
+# counters are total_increasing (a drop counts as a reset), gauges are measurement.
+_TOTAL = SensorStateClass.TOTAL_INCREASING
+_GAUGE = SensorStateClass.MEASUREMENT
+_ENUM = SensorDeviceClass.ENUM
+
 _META: Dict[str, Dict[str, Any]] = {
     "last_seen":      {"icon": "mdi:clock-check", "device_class": SensorDeviceClass.TIMESTAMP},
-    "handshakes":     {"icon": "mdi:handshake"},
-    "points":         {"icon": "mdi:star"},
-    "epochs":         {"icon": "mdi:progress-clock"},
-    "train_epochs":   {"icon": "mdi:arm-flex"},
-    "cpu_temp":       {"icon": "mdi:thermometer", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS},
-    "age_index":      {"icon": "mdi:crown-outline"},
-    "age_title":      {"icon": "mdi:crown"},
-    "traveler_xp":    {"icon": "mdi:map-marker-distance"},
-    "traveler_title": {"icon": "mdi:suitcase"},
-    "strength_title": {"icon": "mdi:lightning-bolt"},
-    "face":           {"icon": "mdi:emoticon-outline"},
-    "mood":           {"icon": "mdi:emoticon"},
+    "handshakes":     {"icon": "mdi:handshake", "state_class": _TOTAL},
+    "points":         {"icon": "mdi:star", "state_class": _TOTAL},
+    "epochs":         {"icon": "mdi:progress-clock", "state_class": _TOTAL},
+    "train_epochs":   {"icon": "mdi:arm-flex", "state_class": _TOTAL},
+    "cpu_temp":       {"icon": "mdi:thermometer", "device_class": SensorDeviceClass.TEMPERATURE, "unit": UnitOfTemperature.CELSIUS, "state_class": _GAUGE},
+    "age_index":      {"icon": "mdi:crown-outline", "enabled": False},  # same information as Age Title
+    "age_title":      {"icon": "mdi:crown", "device_class": _ENUM, "options": AGE_TITLE_OPTIONS},
+    "traveler_xp":    {"icon": "mdi:map-marker-distance", "state_class": _TOTAL},
+    "traveler_title": {"icon": "mdi:suitcase", "device_class": _ENUM, "options": TRAVELER_TITLE_OPTIONS},
+    "strength_title": {"icon": "mdi:lightning-bolt", "device_class": _ENUM, "options": STRENGTH_TITLE_OPTIONS},
+    "face":           {"icon": "mdi:emoticon-outline", "device_class": _ENUM, "options": FACE_OPTIONS},
+    "mood":           {"icon": "mdi:emoticon", "device_class": _ENUM, "options": MOOD_OPTIONS},
+    "handshakes_per_hour":  {"icon": "mdi:handshake-outline", "unit": "1/h", "state_class": _GAUGE},
+    "points_per_hour":      {"icon": "mdi:star-outline", "unit": "1/h", "state_class": _GAUGE},
+    "epochs_per_hour":      {"icon": "mdi:progress-clock", "unit": "1/h", "state_class": _GAUGE},
+    "traveler_xp_per_hour": {"icon": "mdi:map-marker-distance", "unit": "1/h", "state_class": _GAUGE},
+    "battery":      {"device_class": SensorDeviceClass.BATTERY, "unit": PERCENTAGE, "state_class": _GAUGE},
+    "uptime":       {"icon": "mdi:timer-outline", "device_class": SensorDeviceClass.DURATION, "unit": UnitOfTime.SECONDS},
+    "cpu_load":     {"icon": "mdi:chip", "state_class": _GAUGE},
+    "mem_usage":    {"icon": "mdi:memory", "unit": PERCENTAGE, "state_class": _GAUGE},
+    "session_epochs":       {"icon": "mdi:progress-clock", "state_class": _TOTAL},
+    "session_handshakes":   {"icon": "mdi:handshake", "state_class": _TOTAL},
+    "session_deauths":      {"icon": "mdi:wifi-remove", "state_class": _TOTAL},
+    "session_associations": {"icon": "mdi:wifi-plus", "state_class": _TOTAL},
+    "session_missed":       {"icon": "mdi:wifi-alert", "state_class": _TOTAL},
+    "adverts_received":    {"icon": "mdi:counter", "diagnostic": True},
+    "adverts_deduped":     {"icon": "mdi:content-duplicate", "diagnostic": True},
+    "parse_failure_count": {"icon": "mdi:alert-circle-outline", "diagnostic": True},
+    "decode_time_us":      {"icon": "mdi:timer-outline", "unit": UnitOfTime.MICROSECONDS, "diagnostic": True},
+    "update_interval":     {"icon": "mdi:timer-sync-outline", "device_class": SensorDeviceClass.DURATION, "unit": UnitOfTime.SECONDS, "diagnostic": True},
+}
+
+# fleet entry aggregates
+_FLEET_META: Dict[str, Dict[str, Any]] = {
+    "total_handshakes": {"icon": "mdi:handshake", "state_class": _TOTAL},
+    "devices_online":   {"icon": "mdi:account-group", "state_class": _GAUGE},
 }
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities) -> None:
     data = hass.data[DOMAIN][entry.entry_id]
+    states: StateStore = data["states"]
+    if data.get("fleet"):
+        @callback
+        def _add_device(address: str) -> None:
+            name = _device_name(states, address)
+            async_add_entities([PwnagotchiSensor(states, address, key, name) for key in _KEYS + _DIAG_KEYS])
+
+        entry.async_on_unload(async_dispatcher_connect(hass, _sig_new(entry.entry_id), _add_device))
+        for state in states:
+            _add_device(state.address)
+        async_add_entities([PwnagotchiFleetSensor(states, entry.entry_id, key) for key in _FLEET_META])
+        return
     address: str = data.get("address") or entry.unique_id or "pwnagotchi"
-    entities: list[Entity] = [PwnagotchiSensor(address, key) for key in _KEYS]
+    entities: list[Entity] = [PwnagotchiSensor(states, address, key) for key in _KEYS + _DIAG_KEYS]
     async_add_entities(entities)
 
 class PwnagotchiSensor(SensorEntity):
     _attr_has_entity_name = True
     _attr_should_poll = False
 
-    def __init__(self, address: str, key: str) -> None:
+    def __init__(self, states: StateStore, address: str, key: str, device_name: str = "Pwnagotchi") -> None:
+        self._states = states
         self._address = address
         self._key = key
         base = address or "pwnagotchi"
@@ -66,7 +129,7 @@ class PwnagotchiSensor(SensorEntity):
             connections={(CONNECTION_BLUETOOTH, base)},
             manufacturer="Pwnagotchi",
             model="BLE Beacon",
-            name="Pwnagotchi",
+            name=device_name,
         )
 
         meta = _META.get(key, {})
@@ -76,23 +139,77 @@ class PwnagotchiSensor(SensorEntity):
             self._attr_device_class = meta["device_class"]
         if "unit" in meta:
             self._attr_native_unit_of_measurement = meta["unit"]
+        if "state_class" in meta:
+            self._attr_state_class = meta["state_class"]
+        if "options" in meta:
+            self._attr_options = meta["options"]
+        if meta.get("diagnostic"):
+            self._attr_entity_category = EntityCategory.DIAGNOSTIC
+            self._attr_entity_registry_enabled_default = False
+        if meta.get("enabled") is False:
+            self._attr_entity_registry_enabled_default = False
 
     def _nice(self, key: str) -> str:
         nm = key.replace("_", " ").title()
-        nm = nm.replace("Cpu Temp", "CPU Temp")
+        nm = nm.replace("Cpu ", "CPU ").replace("Decode Time Us", "Decode Time")
         return nm
 
     @property
     def available(self) -> bool:
-        return self._address in LAST_VALUES
+        state = self._states.get(self._address)
+        return state is not None and state.online
 
     @property
     def native_value(self) -> Any:
-        return LAST_VALUES.get(self._address, {}).get(self._key)
+        state = self._states.get(self._address)
+        if state is None:
+            return None
+        value = state.get(self._key)
+        if self._key == "last_seen" and isinstance(value, datetime):
+            # floored to LAST_SEEN_RESOLUTION; an unchanged state is not recorded again
+            ts = value.timestamp() // LAST_SEEN_RESOLUTION * LAST_SEEN_RESOLUTION
+            value = datetime.fromtimestamp(ts, value.tzinfo)
+        return value
 
     async def async_added_to_hass(self) -> None:
         self.async_on_remove(async_dispatcher_connect(self.hass, _sig(self._address), self._handle_update))
 
+    @callback
+    def _handle_update(self, changed: Set[str] | None = None) -> None:
+        if changed is None or self._key in changed or ONLINE_KEY in changed:
+            self.async_write_ha_state()
+
+class PwnagotchiFleetSensor(SensorEntity):
+    """Aggregate over every device of a fleet entry, recounted only when one changes."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+
+    def __init__(self, states: StateStore, entry_id: str, key: str) -> None:
+        self._states = states
+        self._entry_id = entry_id
+        self._key = key
+        self._attr_unique_id = f"{entry_id}|{key}"
+        self._attr_name = f"Pwnagotchi Fleet {key.replace('_', ' ').title()}"
+        self._attr_icon = _FLEET_META[key]["icon"]
+        self._attr_state_class = _FLEET_META[key]["state_class"]
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, f"fleet_{entry_id}")},
+            manufacturer="Pwnagotchi",
+            model="BLE Beacon fleet",
+            name="Pwnagotchi Fleet",
+        )
+
+    @property
+    def native_value(self) -> Any:
+        if self._key == "total_handshakes":
+            return sum(state.handshakes or 0 for state in self._states)
+        return sum(1 for state in self._states if state.online)
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(async_dispatcher_connect(self.hass, _sig_fleet(self._entry_id), self._handle_update))
+        self.async_on_remove(async_dispatcher_connect(self.hass, SIGNAL_OFFLINE, self._handle_update))
+
     @callback
     def _handle_update(self) -> None:
         self.async_write_ha_state()
@@ -0,0 +1,343 @@
+\
+from __future__ import annotations
+import heapq
+import itertools
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .const import (
+    UNKNOWN, FACE_ID_TO_FACE, FACE_ID_TO_MOOD,
+    age_index_from_epochs, age_title_from_epochs, strength_title_from_train, traveler_title_from_xp,
+)
+from .rates import CounterTotals, RateWindow
+
+# Decoded fields carried by PwnagotchiState; everything _parse_payload can return.
+FIELDS = (
+    "handshakes",
+    "points",
+    "epochs",
+    "cpu_temp",
+    "traveler_xp",
+    "train_epochs",
+    "face_id",
+    # health frame
+    "battery",
+    "uptime",
+    "cpu_load",
+    "mem_usage",
+    # session frame
+    "session_epochs",
+    "session_handshakes",
+    "session_deauths",
+    "session_associations",
+    "session_missed",
+)
+_FIELD_SET = frozenset(FIELDS)
+
+# Fields derived from a decoded one: key -> (source field, function). They are computed
+# on first read and memoized against the source value, so the advert path only stores
+# raw numbers and the cost is paid by the entities that are actually enabled.
+DERIVED_FIELDS: Dict[str, Tuple[str, Callable[[Any], Any]]] = {
+    "age_index": ("epochs", age_index_from_epochs),
+    "age_title": ("epochs", age_title_from_epochs),
+    "strength_title": ("train_epochs", strength_title_from_train),
+    "traveler_title": ("traveler_xp", traveler_title_from_xp),
+    "face": ("face_id", lambda face_id: FACE_ID_TO_FACE.get(face_id, UNKNOWN)),
+    "mood": ("face_id", lambda face_id: FACE_ID_TO_MOOD.get(face_id, UNKNOWN)),
+}
+_DERIVED_BY_SOURCE: Dict[str, FrozenSet[str]] = {
+    source: frozenset(k for k, (s, _) in DERIVED_FIELDS.items() if s == source)
+    for source, _ in DERIVED_FIELDS.values()
+}
+_EWMA = 0.2  # weight of the newest sample in rolling averages
+
+# Derived per-hour rates: sensor key -> counter it is computed from
+RATE_FIELDS: Dict[str, str] = {
+    "handshakes_per_hour": "handshakes",
+    "points_per_hour": "points",
+    "epochs_per_hour": "epochs",
+    "traveler_xp_per_hour": "traveler_xp",
+}
+
+# Decode-path diagnostics exposed as (disabled by default) sensors
+DIAG_FIELDS = (
+    "adverts_received",
+    "adverts_deduped",
+    "parse_failure_count",
+    "decode_time_us",
+    "update_interval",
+)
+
+class PwnagotchiState:
+    """Last known state of one beacon address.
+
+    Keeps the raw manufacturer payload; its hex form is only built when read.
+    ``frames`` holds the last payload of each frame kind, for per-kind dedupe.
+    """
+
+    __slots__ = FIELDS + tuple(RATE_FIELDS) + (
+        "address",
+        "raw",
+        "frames",
+        "rssi",
+        "last_seen",
+        "last_seen_slot",
+        "touched",
+        "device_info",
+        "published_at",
+        "pending",
+        "cancel_publish",
+        "online",
+        "stale_at",
+        # decode-path diagnostics
+        "adverts_received",
+        "adverts_deduped",
+        "parse_failures",
+        "decode_avg",
+        "changed_at",
+        "update_interval",
+        "rates",
+        "rates_at",
+        "totals",
+        "_derived",
+        "_hex",
+    )
+
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self.raw: Optional[bytes] = None
+        self.frames: Dict[int, bytes] = {}
+        self.rssi: Optional[int] = None
+        self.last_seen: Optional[datetime] = None
+        self.last_seen_slot: Optional[int] = None  # LAST_SEEN_RESOLUTION step last published
+        self.touched = 0.0           # monotonic time of the last advert, for LRU/TTL eviction
+        self.device_info: Any = None
+        self.published_at = float("-inf")
+        self.pending: Optional[Set[str]] = None
+        self.cancel_publish: Optional[Callable[[], None]] = None
+        self.online = False
+        self.stale_at: Optional[float] = None  # monotonic deadline; None once evicted
+        self.adverts_received = 0
+        self.adverts_deduped = 0
+        self.parse_failures: Dict[int, int] = {}  # frame version -> count
+        self.decode_avg: Optional[float] = None   # EWMA seconds
+        self.changed_at: Optional[float] = None
+        self.update_interval: Optional[float] = None  # EWMA seconds between payload changes
+        self._hex: Optional[tuple] = None
+        self._derived: Dict[str, Tuple[Any, Any]] = {}  # key -> (source value, derived value)
+        self.rates: Dict[str, RateWindow] = {}
+        self.rates_at = float("-inf")
+        self.totals: Optional[CounterTotals] = None  # only with reconstruct_totals
+        for key in FIELDS + tuple(RATE_FIELDS):
+            setattr(self, key, None)
+
+    @property
+    def payload_hex(self) -> Optional[str]:
+        raw = self.raw
+        if raw is None:
+            return None
+        cached = self._hex
+        if cached is None or cached[0] is not raw:
+            cached = self._hex = (raw, raw.hex())
+        return cached[1]
+
+    @property
+    def parse_failure_count(self) -> int:
+        return sum(self.parse_failures.values())
+
+    @property
+    def decode_time_us(self) -> Optional[float]:
+        return None if self.decode_avg is None else round(self.decode_avg * 1e6, 1)
+
+    def record_decode(self, now: float, version: int, seconds: float, ok: bool) -> None:
+        """Account one full decode (a payload that differed from the previous one)."""
+        self.decode_avg = seconds if self.decode_avg is None else self.decode_avg * (1 - _EWMA) + seconds * _EWMA
+        if not ok:
+            self.parse_failures[version] = self.parse_failures.get(version, 0) + 1
+        if self.changed_at is not None:
+            dt = now - self.changed_at
+            self.update_interval = dt if self.update_interval is None else self.update_interval * (1 - _EWMA) + dt * _EWMA
+        self.changed_at = now
+
+    def sample_rates(self, now: float) -> None:
+        """Feed the current counters into the rate windows."""
+        for rate_key, counter in RATE_FIELDS.items():
+            value = getattr(self, counter)
+            if value is None:
+                continue
+            window = self.rates.get(rate_key)
+            if window is None:
+                window = self.rates[rate_key] = RateWindow()
+            window.add(now, value)
+
+    def refresh_rates(self, now: float) -> Set[str]:
+        """Recompute the rate fields; returns the ones that changed."""
+        self.rates_at = now
+        changed: Set[str] = set()
+        for rate_key, window in self.rates.items():
+            value = window.rate(now)
+            if getattr(self, rate_key) != value:
+                setattr(self, rate_key, value)
+                changed.add(rate_key)
+        return changed
+
+    def diagnostics(self) -> Dict[str, Any]:
+        return {
+            "online": self.online,
+            "rssi": self.rssi,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "payload_hex": self.payload_hex,
+            "frames": {f"0x{kind:02x}": raw.hex() for kind, raw in sorted(self.frames.items())},
+            "adverts_received": self.adverts_received,
+            "adverts_deduped": self.adverts_deduped,
+            "parse_failures": {f"v{v}": n for v, n in sorted(self.parse_failures.items())},
+            "decode_time_us": self.decode_time_us,
+            "update_interval_s": None if self.update_interval is None else round(self.update_interval, 2),
+            "values": {key: self.get(key) for key in FIELDS + tuple(DERIVED_FIELDS) + tuple(RATE_FIELDS)},
+        }
+
+    def as_stored(self) -> Dict[str, Any]:
+        """Compact form persisted across restarts; see AdvertProcessor.restore."""
+        out: Dict[str, Any] = {
+            "frames": [raw.hex() for raw in self.frames.values()],
+            "rssi": self.rssi,
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+        }
+        if self.totals is not None:
+            out["totals"] = self.totals.as_dict()
+        return out
+
+    def get(self, key: str) -> Any:
+        spec = DERIVED_FIELDS.get(key)
+        if spec is None:
+            return getattr(self, key, None)
+        source = getattr(self, spec[0])
+        if source is None:
+            return None
+        memo = self._derived.get(key)
+        if memo is not None and memo[0] == source:
+            return memo[1]
+        value = spec[1](source)
+        self._derived[key] = (source, value)
+        return value
+
+    def apply(self, stats: Dict[str, Any]) -> Set[str]:
+        """Store decoded fields; returns the keys whose value changed, plus the derived
+        keys that may have changed with them. Unknown keys are ignored."""
+        changed: Set[str] = set()
+        for key, value in stats.items():
+            if key in _FIELD_SET and getattr(self, key) != value:
+                setattr(self, key, value)
+                changed.add(key)
+        for key in changed.intersection(_DERIVED_BY_SOURCE):
+            changed |= _DERIVED_BY_SOURCE[key]
+        return changed
+
+class StateStore:
+    """address -> PwnagotchiState for one config entry.
+
+    Pinned (configured) addresses are kept for the life of the entry. Other addresses
+    are capped: at most ``max_unpinned`` are kept (least recently seen evicted first)
+    and those not seen for ``ttl`` seconds are dropped. 0 disables either limit.
+    """
+
+    def __init__(self, pinned: Iterable[str] = (), max_unpinned: int = 0, ttl: float = 0) -> None:
+        self._states: "OrderedDict[str, PwnagotchiState]" = OrderedDict()
+        self.pinned: Set[str] = {a for a in pinned if a}
+        self.max_unpinned = int(max_unpinned)
+        self.ttl = float(ttl)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._states
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __iter__(self) -> Iterator[PwnagotchiState]:
+        return iter(list(self._states.values()))
+
+    def get(self, address: str) -> Optional[PwnagotchiState]:
+        return self._states.get(address)
+
+    def touch(self, address: str, now: float) -> PwnagotchiState:
+        """Return the state for address (creating it), marking it most recently seen."""
+        state = self._states.get(address)
+        if state is None:
+            state = self._states[address] = PwnagotchiState(address)
+            state.touched = now
+            self.prune(now)
+        else:
+            self._states.move_to_end(address)
+            state.touched = now
+        return state
+
+    def prune(self, now: float) -> int:
+        unpinned = [a for a in self._states if a not in self.pinned]
+        drop = []
+        if self.ttl > 0:
+            drop = [a for a in unpinned if now - self._states[a].touched > self.ttl]
+        if self.max_unpinned > 0:
+            over = len(unpinned) - len(drop) - self.max_unpinned
+            if over > 0:
+                drop += [a for a in unpinned if a not in drop][:over]
+        for address in drop:
+            self.pop(address)
+        return len(drop)
+
+    def pop(self, address: str) -> Optional[PwnagotchiState]:
+        state = self._states.pop(address, None)
+        if state is not None:
+            state.stale_at = None  # the presence tracker drops it on its next tick
+            if state.cancel_publish is not None:
+                state.cancel_publish()
+                state.cancel_publish = None
+        return state
+
+    def clear(self) -> None:
+        for address in list(self._states):
+            self.pop(address)
+
+    def dump(self) -> Dict[str, Any]:
+        """Every device that has decoded at least one frame, in persisted form."""
+        return {"devices": {a: s.as_stored() for a, s in self._states.items() if s.frames}}
+
+class PresenceTracker:
+    """Integration-wide staleness deadlines for every online device.
+
+    An advert only moves ``state.stale_at`` forward (O(1)); the heap holds at most one
+    entry per online device and is re-keyed lazily when an entry reaches the top with
+    an outdated deadline. ``expire(now)`` is therefore O(1) when nothing is due, and
+    reports only the devices that actually crossed the threshold.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, PwnagotchiState]] = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def seen(self, state: PwnagotchiState, now: float, timeout: float) -> bool:
+        """Record an advert; returns True if the device just came online."""
+        state.stale_at = now + timeout
+        if state.online:
+            return False
+        state.online = True
+        heapq.heappush(self._heap, (state.stale_at, next(self._seq), state))
+        return True
+
+    def expire(self, now: float) -> List[PwnagotchiState]:
+        """Pop due deadlines; returns the states that just went offline."""
+        gone: List[PwnagotchiState] = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, state = heapq.heappop(heap)
+            if state.stale_at is None:
+                state.online = False            # evicted, nobody to notify
+            elif state.stale_at > now:
+                heapq.heappush(heap, (state.stale_at, next(self._seq), state))
+            else:
+                state.online = False
+                gone.append(state)
+        return gone
@@ -1,4 +1,4 @@
-import os, json, time, threading, struct, subprocess, logging
+import os, errno, fcntl, glob, json, time, threading, struct, subprocess, logging, socket, select, ctypes, ctypes.util
 
 import pwnagotchi
 import pwnagotchi.plugins as plugins
@@ -12,6 +12,30 @@ DEFAULTS = {
     "company_id": 0xFFFF,
     "hci": "hci0",
     "broadcast_face": True,   # toggle face in BLE v6
+    "backend": "auto",        # auto | socket | hcitool
+    "refresh_s": 300,         # re-program an unchanged payload at least this often (0 = every tick)
+    "inotify": True,          # watch the JSON files instead of stat()ing them every tick
+    "event_driven": True,     # re-advertise right away on handshake/epoch/face/file changes
+    "min_update_s": 1.0,      # minimum spacing between event-driven updates
+    "schedule": "fixed",      # fixed (interval_s) | adaptive (min_interval_s..max_interval_s)
+    "min_interval_s": 5,
+    "max_interval_s": 120,
+    "adv_interval_ms": 1280,  # controller advertising interval in fixed mode
+    "adv_per_update": 10,     # adaptive mode: air-time adverts per update period
+    "thermal_path": "/sys/class/thermal/thermal_zone0/temp",  # glob or list: hottest zone wins
+    "temp_sample_s": 2.0,     # re-read sysfs temperature at most this often
+    "temp_smoothing": 1.0,    # EWMA weight of the newest temperature sample (1 = no smoothing)
+    "health_sample_s": 10.0,  # same for battery / load / memory / uptime
+    "health_smoothing": 1.0,
+    "diag_path": "/tmp/ble_beacon.diag",  # "" disables the diag file
+    "diag_max_bytes": 262144, # rotate to <diag_path>.1 past this size
+    "wide_counters": False,   # v7 frame: varint counters up to 2^28 (needs a v7-aware integration)
+    "wrap_counters": False,   # v5/v6: send counters modulo 65536 instead of clamping at 65535
+    "health_s": 0,            # rotate a health frame (battery, uptime, load, memory) in every N s (0 = off)
+    "session_s": 0,           # rotate a session-counters frame in every N s (0 = off)
+    "frame_dwell_s": 5,       # how long a rotated-in frame stays on air before the core frame returns
+    "scan_response": False,   # carry the health frame in the scan response instead (active scanners only)
+    "battery_path": "",       # e.g. /sys/class/power_supply/BAT0/capacity, "auto", or "" (no battery)
 }
 
 # Keep in sync with Home Assistant const.py
@@ -41,6 +65,858 @@ FACE_TABLE = {
 FACE_STR_TO_ID = {v: k for k, v in FACE_TABLE.items()}
 FACE_REV = 1
 
+# --- frame schemas ------------------------------------------------------------
+# Keep in sync with Home Assistant frames.py. Fields follow the version byte; each
+# value is clamped to its (lo, hi) range and packed with a precompiled struct.
+# Optional varint fields (unsigned LEB128) follow the fixed part.
+
+U8 = (0, 0xFF)
+U16 = (0, 0xFFFF)
+U32 = (0, 0xFFFFFFFF)
+U28 = (0, (1 << 28) - 1)  # 4 varint bytes
+# 31 bytes of advertising data minus flags (3) and the manufacturer AD header (4)
+MAX_PAYLOAD = 24
+WIDE_COUNTERS = ("handshakes", "points", "epochs", "traveler_xp", "train_epochs")
+SESSION_COUNTERS = ("session_epochs", "session_handshakes", "session_deauths", "session_associations",
+                    "session_missed")
+# high nibble of the version byte = frame kind; the integration merges kinds per address
+KIND_HEALTH = 0x10
+KIND_SESSION = 0x20
+BATTERY_UNKNOWN = 0xFF
+
+
+def varint_into(buf, value):
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if value:
+            buf.append(b | 0x80)
+        else:
+            buf.append(b)
+            return
+
+
+class FrameSchema:
+    __slots__ = ("version", "codec", "fields", "varints", "_buf")
+
+    def __init__(self, version, fmt, fields, varints=()):
+        self.version = version
+        self.codec = struct.Struct(fmt)
+        self.fields = tuple(fields)
+        self.varints = tuple(varints)
+        self._buf = bytearray(self.codec.size)
+
+    @property
+    def max_size(self):
+        """Longest encoding: the fixed part plus every varint at its clamp value."""
+        return self.codec.size + sum(-(-max(hi.bit_length(), 1) // 7) for _, (_, hi) in self.varints)
+
+    def pack(self, values):
+        args = [min(hi, max(lo, int(values.get(name, 0)))) for name, (lo, hi) in self.fields]
+        self.codec.pack_into(self._buf, 0, self.version, *args)
+        if not self.varints:
+            return bytes(self._buf)
+        out = bytearray(self._buf)
+        for name, (lo, hi) in self.varints:
+            varint_into(out, min(hi, max(lo, int(values.get(name, 0)))))
+        return bytes(out)
+
+
+FRAME_SCHEMAS = {}
+
+
+def register_frame(version, fmt, fields, varints=()):
+    schema = FrameSchema(version, fmt, fields, varints)
+    assert schema.max_size <= MAX_PAYLOAD, f"frame 0x{version:02x} can take {schema.max_size} bytes"
+    FRAME_SCHEMAS[version] = schema
+    return schema
+
+
+_CORE_FIELDS = (("handshakes", U16), ("points", U16), ("epochs", U16), ("cpu_temp_x2", U8),
+                ("traveler_xp", U16), ("train_epochs", U16))
+register_frame(5, "<BHHHBHH", _CORE_FIELDS)
+# ver(6), hs, pts, ep, cpu*2, trav_xp, train_ep, face_id, face_rev
+register_frame(6, "<BHHHBHHBB", _CORE_FIELDS + (("face_id", U8), ("face_rev", U8)))
+# ver(7), cpu*2, face_id, face_rev, then hs, pts, ep, trav_xp, train_ep as varints (<= 24 bytes)
+register_frame(7, "<BBBB", (("cpu_temp_x2", U8), ("face_id", U8), ("face_rev", U8)),
+               varints=[(name, U28) for name in WIDE_COUNTERS])
+# health: battery %, uptime s, load1 x100, memory %
+register_frame(KIND_HEALTH, "<BBIHB", (("battery_pct", U8), ("uptime_s", U32), ("load1_x100", U16), ("mem_pct", U8)))
+# session: counters since the plugin was loaded, as varints
+register_frame(KIND_SESSION, "<B", (), varints=[(name, U28) for name in SESSION_COUNTERS])
+
+# --- HCI plumbing -----------------------------------------------------------
+
+HCI_COMMAND_PKT = 0x01
+HCI_EVENT_PKT = 0x04
+EVT_CMD_COMPLETE = 0x0E
+EVT_CMD_STATUS = 0x0F
+OGF_LE_CTL = 0x08
+OCF_LE_SET_ADV_PARAMS = 0x0006
+OCF_LE_SET_ADV_DATA = 0x0008
+OCF_LE_SET_SCAN_RSP_DATA = 0x0009
+OCF_LE_SET_ADV_ENABLE = 0x000A
+ADV_SCAN_IND = 0x02     # scannable, non-connectable (needed for scan response data)
+ADV_NONCONN_IND = 0x03
+ADV_INTERVAL_MIN_UNITS = 0x00A0  # 100 ms, lowest legal interval for non-connectable adverts
+ADV_INTERVAL_MAX_UNITS = 0x4000  # 10.24 s
+# status returned when the command never reached the controller (no event, spawn failure, ...)
+HCI_STATUS_NO_REPLY = -1
+# socket.SOL_HCI / socket.HCI_FILTER are Linux-only; fall back to the kernel values
+SOL_HCI = getattr(socket, "SOL_HCI", 0)
+HCI_FILTER = getattr(socket, "HCI_FILTER", 2)
+HCIDEVUP = 0x400448C9  # _IOW('H', 201, int)
+HCI_STATUS_NAMES = {
+    0x00: "success",
+    0x01: "unknown_command",
+    0x0C: "command_disallowed",
+    0x11: "unsupported",
+    0x12: "invalid_params",
+    HCI_STATUS_NO_REPLY: "no_reply",
+}
+
+
+def hci_opcode(ogf, ocf):
+    return ((ogf & 0x3F) << 10) | (ocf & 0x03FF)
+
+
+def hci_command_packet(ogf, ocf, params=b""):
+    return struct.pack("<BHB", HCI_COMMAND_PKT, hci_opcode(ogf, ocf), len(params)) + bytes(params)
+
+
+def hci_parse_status(pkt, opcode):
+    """Return the status byte of a Command Complete/Status event for opcode, else None."""
+    if len(pkt) < 3 or pkt[0] != HCI_EVENT_PKT:
+        return None
+    evt, plen = pkt[1], pkt[2]
+    body = pkt[3:3 + plen]
+    if evt == EVT_CMD_COMPLETE and len(body) >= 4:
+        # ncmd(1) opcode(2) status(1) ...
+        if int.from_bytes(body[1:3], "little") == opcode:
+            return body[3]
+    elif evt == EVT_CMD_STATUS and len(body) >= 4:
+        # status(1) ncmd(1) opcode(2)
+        if int.from_bytes(body[2:4], "little") == opcode:
+            return body[0]
+    return None
+
+
+def hci_dev_id(hci):
+    try:
+        return int(str(hci).replace("hci", "") or 0)
+    except ValueError:
+        return 0
+
+
+def hci_dev_up(sock, dev_id):
+    """Bring the adapter up (what ``hciconfig up`` does); already up is fine."""
+    try:
+        fcntl.ioctl(sock, HCIDEVUP, dev_id)
+    except OSError as e:
+        if e.errno != errno.EALREADY:
+            raise
+
+
+def adv_interval_units(ms):
+    """Advertising interval in 0.625 ms controller units, clamped to the legal range."""
+    return max(ADV_INTERVAL_MIN_UNITS, min(ADV_INTERVAL_MAX_UNITS, int(round(ms / 0.625))))
+
+
+def adv_params_nonconn(min_units=0x0800, max_units=0x0800, adv_type=ADV_NONCONN_IND):
+    # interval min/max (0.625 ms units), type, own addr, peer addr type, peer addr, channel map, filter
+    return struct.pack("<HHBBB6sBB", min_units, max_units, adv_type, 0, 0, bytes(6), 0x07, 0)
+
+
+def hci_status_name(status):
+    return HCI_STATUS_NAMES.get(status, f"0x{status & 0xFF:02x}")
+
+
+# --- instrumentation ----------------------------------------------------------
+
+class DiagLog:
+    """Append-only diag file (default /tmp/ble_beacon.diag) rotated to <path>.1 at max_bytes."""
+
+    def __init__(self, path, max_bytes=262144):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._f = None
+        self._size = 0
+
+    def write(self, event, **fields):
+        line = time.strftime("%Y-%m-%dT%H:%M:%S") + " " + event
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        with self._lock:
+            try:
+                if self._f is None:
+                    self._f = open(self.path, "a", buffering=1)
+                    self._size = self._f.tell()
+                self._f.write(line + "\n")
+                self._size += len(line) + 1
+                if self._size > self.max_bytes:
+                    self._f.close()
+                    os.replace(self.path, self.path + ".1")
+                    self._f = None
+            except OSError:
+                self._f = None
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, dt):
+        self.count += 1
+        self.total += dt
+        self.last = dt
+        if dt > self.max:
+            self.max = dt
+
+    def as_dict(self):
+        avg = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "avg_ms": round(avg * 1e3, 3), "max_ms": round(self.max * 1e3, 3),
+                "last_ms": round(self.last * 1e3, 3)}
+
+
+class BeaconMetrics:
+    """Hot-path timings, HCI status counters and tick jitter for the beacon.
+
+    Everything is plain counters updated from the beacon thread; ``snapshot()`` is
+    what the web hook serves.
+    """
+
+    def __init__(self, diag=None):
+        self.diag = diag
+        self.started = time.time()
+        self.timings = {}
+        self.hci = {}        # "0x0008" -> {"success": n, "command_disallowed": n, ...}
+        self.jitter = _Timing()
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def time(self, name, dt):
+        t = self.timings.get(name)
+        if t is None:
+            with self._lock:
+                t = self.timings.setdefault(name, _Timing())
+        t.add(dt)
+
+    def hci_result(self, ocf, status, dt):
+        key = f"0x{ocf:04x}"
+        self.time("hci_" + key, dt)
+        name = hci_status_name(status)
+        with self._lock:
+            by_status = self.hci.setdefault(key, {})
+            by_status[name] = by_status.get(name, 0) + 1
+        if status != 0 and self.diag is not None:
+            self.diag.write("hci", ocf=key, status=name, ms=round(dt * 1e3, 1))
+
+    def run_failed(self, cmd, returncode, stderr):
+        if self.diag is not None:
+            err = (stderr or b"").decode("utf-8", "replace").strip().replace("\n", " | ")
+            self.diag.write("run", cmd=" ".join(cmd[:6]), rc=returncode, stderr=repr(err[:200]))
+
+    def error(self, where, exc):
+        self.errors += 1
+        self.last_error = f"{where}: {exc!r}"
+        if self.diag is not None:
+            self.diag.write("error", where=where, exc=repr(exc))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "timings": {k: v.as_dict() for k, v in self.timings.items()},
+                "hci_status": {k: dict(v) for k, v in self.hci.items()},
+                "tick_jitter": self.jitter.as_dict(),
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
+
+
+class HCISocketAdvertiser:
+    """Programs legacy advertising over one long-lived raw HCI socket."""
+    name = "socket"
+
+    def __init__(self, hci="hci0", sock=None, timeout=1.0):
+        self.hci = hci
+        self.timeout = timeout
+        self._sock = sock
+        self.metrics = None
+
+    def open(self):
+        if self._sock is not None:
+            return
+        s = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_RAW, socket.BTPROTO_HCI)
+        try:
+            # only deliver Command Complete / Command Status events to us
+            evt_mask = (1 << EVT_CMD_COMPLETE) | (1 << EVT_CMD_STATUS)
+            s.setsockopt(SOL_HCI, HCI_FILTER, struct.pack("<IIIH", 1 << HCI_EVENT_PKT, evt_mask, 0, 0))
+            s.bind((hci_dev_id(self.hci),))
+            s.settimeout(self.timeout)
+            hci_dev_up(s, hci_dev_id(self.hci))
+        except Exception:
+            s.close()
+            raise
+        self._sock = s
+
+    def close(self):
+        s, self._sock = self._sock, None
+        if s is not None:
+            try:
+                s.close()
+            except Exception:
+                pass
+
+    def command(self, ocf, params=b"", ogf=OGF_LE_CTL):
+        """Send one HCI command and wait for its completion; returns the HCI status."""
+        self.open()
+        t0 = time.perf_counter()
+        opcode = hci_opcode(ogf, ocf)
+        self._sock.send(hci_command_packet(ogf, ocf, params))
+        deadline = time.monotonic() + self.timeout
+        status = HCI_STATUS_NO_REPLY
+        while time.monotonic() < deadline:
+            try:
+                pkt = self._sock.recv(260)
+            except socket.timeout:
+                break
+            st = hci_parse_status(pkt, opcode)
+            if st is not None:
+                status = st
+                break
+        if self.metrics is not None:
+            self.metrics.hci_result(ocf, status, time.perf_counter() - t0)
+        return status
+
+    def set_enable(self, on):
+        return self.command(OCF_LE_SET_ADV_ENABLE, b"\x01" if on else b"\x00")
+
+    def advertise(self, data, interval_units=0x0800, scan_data=None):
+        try:
+            return self._advertise(data, interval_units, scan_data)
+        except OSError as e:
+            if e.errno != errno.ENETDOWN:
+                raise
+            # adapter went down under us (hciconfig down, rfkill toggle): bring it up, retry once
+            hci_dev_up(self._sock, hci_dev_id(self.hci))
+            return self._advertise(data, interval_units, scan_data)
+
+    def _advertise(self, data, interval_units, scan_data):
+        # Disabled -> Set Adv Params -> Set Adv Data [-> Set Scan Rsp Data] -> Enabled
+        # (same order btmon shows for hciconfig leadv)
+        adv_type = ADV_NONCONN_IND if scan_data is None else ADV_SCAN_IND
+        statuses = [
+            self.set_enable(False),
+            self.command(OCF_LE_SET_ADV_PARAMS, adv_params_nonconn(interval_units, interval_units, adv_type)),
+            self.command(OCF_LE_SET_ADV_DATA, data),
+        ]
+        if scan_data is not None:
+            statuses.append(self.command(OCF_LE_SET_SCAN_RSP_DATA, scan_data))
+        statuses.append(self.set_enable(True))
+        return statuses
+
+
+class HcitoolAdvertiser:
+    """Fallback backend that forks hcitool/hciconfig (works on any BlueZ userspace)."""
+    name = "hcitool"
+
+    def __init__(self, hci="hci0", timeout=3):
+        self.hci = hci
+        self.timeout = timeout
+        self.metrics = None
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _run(self, cmd):
+        try:
+            p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout, check=False)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.run_failed(cmd, None, str(e).encode())
+            return None
+        if p.returncode != 0 and self.metrics is not None:
+            self.metrics.run_failed(cmd, p.returncode, p.stderr)
+        return p
+
+    def command(self, ocf, params=b"", ogf=OGF_LE_CTL):
+        t0 = time.perf_counter()
+        status = self._command(ocf, params, ogf)
+        if self.metrics is not None:
+            self.metrics.hci_result(ocf, status, time.perf_counter() - t0)
+        return status
+
+    def _command(self, ocf, params, ogf):
+        p = self._run(["/usr/bin/hcitool", "-i", self.hci, "cmd", f"0x{ogf:02x}", f"0x{ocf:04x}",
+                       *[f"{b:02x}" for b in params]])
+        if p is None or p.returncode != 0:
+            return HCI_STATUS_NO_REPLY
+        # hcitool echoes the event as hex after "HCI Event: 0x0e plen N"; status is the 4th byte
+        try:
+            out = p.stdout.decode("ascii", "ignore")
+            evt = out.split("HCI Event:", 1)[1].splitlines()
+            raw = bytes(int(x, 16) for line in evt[1:] for x in line.split())
+            return raw[3]
+        except Exception:
+            return HCI_STATUS_NO_REPLY  # no event in the output: status unknown
+
+    def set_enable(self, on):
+        return self.command(OCF_LE_SET_ADV_ENABLE, b"\x01" if on else b"\x00")
+
+    def advertise(self, data, interval_units=0x0800, scan_data=None):
+        adv_type = ADV_NONCONN_IND if scan_data is None else ADV_SCAN_IND
+        # no "hciconfig leadv": it re-enables advertising with its own ADV_IND params, after
+        # which LE Set Advertising Parameters is rejected with Command Disallowed (0x0C)
+        self._run(["/usr/bin/hciconfig", self.hci, "up"])
+        statuses = [self.set_enable(False)]
+        statuses.append(self.command(OCF_LE_SET_ADV_PARAMS, adv_params_nonconn(interval_units, interval_units, adv_type)))
+        statuses.append(self.command(OCF_LE_SET_ADV_DATA, data))
+        if scan_data is not None:
+            statuses.append(self.command(OCF_LE_SET_SCAN_RSP_DATA, scan_data))
+        statuses.append(self.set_enable(True))
+        return statuses
+
+
+# --- file snapshots ---------------------------------------------------------
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ name)
+
+
+class InotifyWatcher:
+    """Tiny ctypes inotify wrapper: remembers which watched files changed since last asked.
+
+    Directories are watched (not the files) so atomic rename-over writers are seen too.
+    """
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        self._dirs = {}     # wd -> directory
+        self._wds = {}      # directory -> wd
+        self._files = set()
+        self._dirty = set()
+        self._overflows = 0
+        self._seen_gen = {}
+        self._lock = threading.Lock()
+
+    def fileno(self):
+        return self._fd
+
+    def watch(self, path):
+        """Start watching path; returns False if its directory cannot be watched."""
+        d = os.path.dirname(os.path.abspath(path))
+        if d in self._wds:
+            self._files.add(os.path.abspath(path))
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), self.MASK)
+        if wd < 0:
+            return False
+        self._wds[d] = wd
+        self._dirs[wd] = d
+        self._files.add(os.path.abspath(path))
+        return True
+
+    def _drain(self):
+        """Read all queued events; returns True if a watched file changed."""
+        changed = False
+        while True:
+            try:
+                buf = os.read(self._fd, 4096)
+            except OSError:
+                return changed
+            if not buf:
+                return changed
+            off = 0
+            while off + _INOTIFY_EVENT.size <= len(buf):
+                wd, mask, _cookie, nlen = _INOTIFY_EVENT.unpack_from(buf, off)
+                off += _INOTIFY_EVENT.size
+                name = buf[off:off + nlen].rstrip(b"\0")
+                off += nlen
+                if mask & IN_Q_OVERFLOW:
+                    self._overflows += 1
+                    changed = True
+                elif wd in self._dirs:
+                    path = os.path.join(self._dirs[wd], os.fsdecode(name))
+                    if path in self._files:
+                        self._dirty.add(path)
+                        changed = True
+
+    def wait_changed(self, timeout):
+        """Block up to timeout seconds for a watched file to change."""
+        try:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+        except (OSError, ValueError):
+            return False
+        if not ready:
+            return False
+        with self._lock:
+            return self._drain()
+
+    def consume(self, path):
+        """True if path changed (or events were lost to a queue overflow) since the last call."""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._drain()
+            hit = self._seen_gen.get(path) != self._overflows or path in self._dirty
+            self._seen_gen[path] = self._overflows
+            self._dirty.discard(path)
+        return hit
+
+    def close(self):
+        fd, self._fd = self._fd, -1
+        if fd >= 0:
+            os.close(fd)
+
+
+class JsonSnapshot:
+    """Parsed view of a JSON file that is only re-read when the file actually changed.
+
+    Changes are detected by (st_ino, st_mtime_ns, st_size), or by inotify when a watcher
+    is given. If a read fails (e.g. a half-written file) the last good value is kept.
+    """
+
+    def __init__(self, path, extract, default, watcher=None):
+        self.path = path
+        self._extract = extract
+        self._default = default
+        self.value = default
+        self._key = None
+        self._watcher = watcher if watcher is not None and watcher.watch(path) else None
+        self.parses = 0
+
+    def read(self):
+        if self._watcher is not None and self._key is not None and not self._watcher.consume(self.path):
+            return self.value
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._key, self.value = (), self._default
+            return self.value
+        except OSError:
+            return self.value
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self._key:
+            return self.value
+        self._key = key  # remember torn versions too, so we don't re-parse them every tick
+        try:
+            with open(self.path, "r") as f:
+                self.value = self._extract(json.load(f))
+            self.parses += 1
+        except Exception as e:
+            LOGGER.debug("ble_beacon: keeping last good %s (%s)", self.path, e)
+        return self.value
+
+
+def _extract_age(d):
+    return (int(d.get("handshakes", 0)), int(d.get("points", 0)), int(d.get("epochs", 0)),
+            int(d.get("train_epochs", d.get("trainings", 0))))
+
+
+def _extract_traveler(d):
+    return int(d.get("travel_xp", 0))
+
+
+class UpdateScheduler:
+    """Coalesces wake-up requests for the beacon loop.
+
+    ``wait(timeout)`` returns when the periodic timeout expires or as soon as a request
+    is pending, but never sooner than ``min_spacing`` after the previous update, so a
+    burst of events collapses into one re-advertise.
+    """
+
+    def __init__(self, min_spacing=1.0):
+        self.min_spacing = float(min_spacing)
+        self._cond = threading.Condition()
+        self._reasons = set()
+        self._last = float("-inf")
+        self._closed = False
+        self.requests = 0
+
+    def request(self, reason):
+        with self._cond:
+            self.requests += 1
+            self._reasons.add(reason)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """Returns the set of reasons that triggered this update (empty for a periodic tick)."""
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while not self._closed:
+                now = time.monotonic()
+                if self._reasons:
+                    earliest = self._last + self.min_spacing
+                    if now >= earliest:
+                        break
+                    until = min(earliest, deadline)
+                else:
+                    until = deadline
+                if now >= deadline:
+                    break
+                self._cond.wait(until - now)
+            reasons, self._reasons = self._reasons, set()
+            self._last = time.monotonic()
+            return reasons
+
+
+class AdaptiveInterval:
+    """Update period that follows the rate of change of the advertised stats.
+
+    Every tick with a changed payload halves the period (down to min_s); every
+    unchanged tick doubles it (up to max_s). A sleeping unit goes straight to max_s.
+    """
+
+    def __init__(self, min_s=5.0, max_s=120.0, start_s=20.0):
+        self.min_s = float(min_s)
+        self.max_s = max(self.min_s, float(max_s))
+        self.period = max(self.min_s, min(self.max_s, float(start_s)))
+
+    def update(self, changed, sleeping=False):
+        if sleeping:
+            self.period = self.max_s
+        elif changed:
+            self.period = max(self.min_s, self.period / 2.0)
+        else:
+            self.period = min(self.max_s, self.period * 2.0)
+        return self.period
+
+
+class FrameRotation:
+    """Picks the frame that goes on air each tick.
+
+    The primary (core) frame goes out whenever its payload changes. Secondary frames
+    go out once their period has elapsed, most overdue first, and hand the air back
+    to the primary after ``dwell_s``. A primary change only waits for a secondary
+    frame that is overdue by a full period, so neither side starves.
+    """
+
+    def __init__(self, primary, periods, dwell_s=5.0, now=0.0):
+        self.primary = primary
+        self.periods = {v: float(p) for v, p in periods.items() if p and float(p) > 0}
+        self.due = {v: now + p for v, p in self.periods.items()}
+        self.dwell_s = float(dwell_s)
+
+    def pick(self, now, primary_changed):
+        overdue = [(due, v) for v, due in self.due.items() if now >= due]
+        if overdue:
+            due, version = min(overdue)
+            if not primary_changed or now - due >= self.periods[version]:
+                return version
+        return self.primary
+
+    def sent(self, version, now):
+        if version in self.periods:
+            self.due[version] = now + self.periods[version]
+
+    def hold(self, version, interval):
+        """Seconds until the next tick after putting ``version`` on air."""
+        return interval if version == self.primary else min(interval, self.dwell_s)
+
+
+# --- sysfs / procfs sources -----------------------------------------------------
+
+class SysfsSource:
+    """A sysfs/procfs value read through file descriptors kept open for the plugin's life.
+
+    Each sample is one os.pread(fd, n, 0) per path, with no open/close and no Python
+    file object. With several paths the parsed values are combined (``max`` by default,
+    e.g. the hottest thermal zone). Samples are cached for ``period_s`` and smoothed with
+    an EWMA of weight ``alpha``. A failing path is closed and reopened on the next sample;
+    until then the last good value is returned.
+    """
+
+    def __init__(self, paths, parse, period_s=0.0, alpha=1.0, combine=max, size=64):
+        self.paths = list(paths)
+        self.parse = parse
+        self.period_s = float(period_s)
+        self.alpha = float(alpha)
+        self.combine = combine
+        self.size = size
+        self.value = None
+        self._fds = {}
+        self._at = float("-inf")
+
+    def _pread(self, path):
+        fd = self._fds.get(path)
+        if fd is None:
+            fd = self._fds[path] = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        try:
+            return os.pread(fd, self.size, 0)
+        except OSError:
+            self._fds.pop(path, None)
+            os.close(fd)
+            raise
+
+    def read(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self._at < self.period_s:
+            return self.value
+        self._at = now
+        samples = []
+        for path in self.paths:
+            try:
+                samples.append(self.parse(self._pread(path)))
+            except (OSError, ValueError, IndexError):
+                continue
+        if not samples:
+            return self.value
+        sample = self.combine(samples)
+        if self.value is None or self.alpha >= 1.0:
+            self.value = sample
+        else:
+            self.value = self.value + self.alpha * (sample - self.value)
+        return self.value
+
+    def close(self):
+        fds, self._fds = self._fds, {}
+        for fd in fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def _parse_int(data):
+    return int(data.split()[0])
+
+
+def _parse_first_float(data):
+    # /proc/uptime, /proc/loadavg
+    return float(data.split()[0])
+
+
+def _parse_mem_pct(data):
+    total = avail = None
+    for line in data.split(b"\n"):
+        if line.startswith(b"MemTotal:"):
+            total = int(line.split()[1])
+        elif line.startswith(b"MemAvailable:"):
+            avail = int(line.split()[1])
+            break
+    if not total or avail is None:
+        raise ValueError("no MemTotal/MemAvailable")
+    return 100.0 * (total - avail) / total
+
+
+def _expand_paths(spec):
+    """A path, a glob pattern or a list of either -> existing paths (sorted per pattern).
+
+    An empty spec (or empty entries) means no paths, not the path "".
+    """
+    specs = [spec] if isinstance(spec, str) else list(spec or ())
+    out = []
+    for item in specs:
+        if not item:
+            continue
+        out.extend(sorted(glob.glob(item)) if glob.has_magic(item) else [item])
+    return out
+
+
+def _battery_paths(spec):
+    if spec != "auto":
+        return _expand_paths(spec)
+    out = []
+    for cap in sorted(glob.glob("/sys/class/power_supply/*/capacity")):
+        try:
+            with open(os.path.join(os.path.dirname(cap), "type"), "r") as f:
+                if f.read().strip() == "Battery":
+                    out.append(cap)
+        except OSError:
+            continue
+    return out[:1]
+
+
+class SensorSources:
+    """The sysfs/procfs values the frames carry, each sampled at its own rate.
+
+    ``snapshot()`` costs a dict lookup per source unless a source's period has run
+    out, so it is cheap enough for every event-driven wake-up.
+    """
+
+    def __init__(self, opts):
+        temp = dict(period_s=opts.get("temp_sample_s", 2.0), alpha=opts.get("temp_smoothing", 1.0))
+        health = dict(period_s=opts.get("health_sample_s", 10.0), alpha=opts.get("health_smoothing", 1.0))
+        self.sources = {
+            "cpu_temp_c": SysfsSource(_expand_paths(opts.get("thermal_path", DEFAULTS["thermal_path"])),
+                                      lambda d: _parse_int(d) / 1000.0, **temp),
+            "battery_pct": SysfsSource(_battery_paths(opts.get("battery_path", "")), _parse_int, **health),
+            "load1": SysfsSource(["/proc/loadavg"], _parse_first_float, **health),
+            "mem_pct": SysfsSource(["/proc/meminfo"], _parse_mem_pct, size=256, **health),
+            # uptime is a clock, smoothing it makes no sense
+            "uptime_s": SysfsSource(["/proc/uptime"], _parse_first_float, period_s=health["period_s"]),
+        }
+
+    def read(self, name, now=None):
+        return self.sources[name].read(now)
+
+    def snapshot(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {name: src.read(now) for name, src in self.sources.items()}
+
+    def close(self):
+        for src in self.sources.values():
+            src.close()
+
+
+def _face_accessor(ui):
+    """() -> current face string for a pwnagotchi View (or anything with get/_state)."""
+    get = getattr(ui, "get", None)
+    # unsafe but common in plugins: fall back to the state dict
+    fallback = getattr(getattr(ui, "_state", None), "get", None)
+    if get is None:
+        return (lambda: fallback("face")) if fallback is not None else (lambda: None)
+    if fallback is None:
+        return lambda: get("face")
+    return lambda: get("face") or fallback("face")
+
+
+def make_advertiser(kind, hci):
+    if kind == "hcitool":
+        return HcitoolAdvertiser(hci)
+    adv = HCISocketAdvertiser(hci)
+    try:
+        adv.open()
+        return adv
+    except Exception as e:
+        if kind == "socket":
+            raise
+        LOGGER.info("ble_beacon: raw HCI socket unavailable (%s), using hcitool", e)
+        return HcitoolAdvertiser(hci)
+
 class BLEBeacon(plugins.Plugin):
     __author__ = "MediaCutlet/Strato"
     __version__ = "0.7.0"
@@ -51,7 +927,25 @@ class BLEBeacon(plugins.Plugin):
         self.opts = dict(DEFAULTS)
         self._stop = threading.Event()
         self._thread = None
+        self._watch_thread = None
+        self._sched = UpdateScheduler()
         self._face_id = 0
+        self._face_str = None
+        self._ui = None
+        self._ui_face = None
+        self._adv = None
+        self._last_data = None
+        self._last_units = None
+        self._last_programmed = 0.0
+        self._adv_units = adv_interval_units(DEFAULTS["adv_interval_ms"])
+        self.counters = {"programmed": 0, "skipped": 0, "failed": 0}
+        self.metrics = BeaconMetrics()
+        self._watcher = None
+        self._age_snap = None
+        self._traveler_snap = None
+        self.session = dict.fromkeys(SESSION_COUNTERS, 0)
+        self._sources = None
+        self._scan_payload = None
 
     def on_loaded(self):
         try:
@@ -59,136 +953,313 @@ class BLEBeacon(plugins.Plugin):
                 self.opts[k] = v
         except Exception:
             pass
+        if self.opts.get("inotify", True):
+            try:
+                self._watcher = InotifyWatcher()
+            except Exception as e:
+                LOGGER.debug("ble_beacon: inotify unavailable (%s), polling with stat()", e)
+        self._age_snap = JsonSnapshot(self.opts["age_json"], _extract_age, (0, 0, 0, 0), self._watcher)
+        self._traveler_snap = JsonSnapshot(self.opts.get("traveler_json", "/root/pwn_traveler.json"),
+                                           _extract_traveler, 0, self._watcher)
+        self._sched.min_spacing = float(self.opts.get("min_update_s", 1.0))
+        if self.opts.get("diag_path"):
+            self.metrics.diag = DiagLog(self.opts["diag_path"], self.opts.get("diag_max_bytes", 262144))
+            self.metrics.diag.write("on_loaded", version=self.__version__, backend=self.opts.get("backend"),
+                                    schedule=self.opts.get("schedule"), event_driven=self.opts.get("event_driven"))
         self._thread = threading.Thread(target=self._loop, name="ble_beacon", daemon=True)
         self._thread.start()
+        if self._watcher is not None and self.opts.get("event_driven", True):
+            self._watch_thread = threading.Thread(target=self._watch_loop, name="ble_beacon_watch", daemon=True)
+            self._watch_thread.start()
+
+    def _wake(self, reason):
+        if self.opts.get("event_driven", True):
+            self._sched.request(reason)
 
-    # capture face changes via UI updates
+    def on_handshake(self, agent, filename, access_point, client_station):
+        self.session["session_handshakes"] += 1
+        self._wake("handshake")
+
+    def on_epoch(self, agent, epoch, epoch_data):
+        s = self.session
+        s["session_epochs"] += 1
+        try:
+            s["session_deauths"] += int(epoch_data.get("num_deauths", 0))
+            s["session_associations"] += int(epoch_data.get("num_associations", 0))
+            s["session_missed"] += int(epoch_data.get("missed_interactions", 0))
+        except Exception:
+            pass
+        self._wake("epoch")
+
+    # capture face changes via UI updates. This runs on every display refresh, so the
+    # accessor is resolved once per ui object and an unchanged face costs one compare.
     def on_ui_update(self, ui):
         try:
-            face = None
-            if hasattr(ui, "get"):
-                face = ui.get("face")
-            # unsafe but common in plugins: try to access state dict
-            if not face and hasattr(ui, "_state"):
-                face = ui._state.get("face")
-            if isinstance(face, str):
-                self._face_id = FACE_STR_TO_ID.get(face, 0)
+            if ui is not self._ui:
+                self._ui, self._ui_face = ui, _face_accessor(ui)
+            face = self._ui_face()
+            if face is self._face_str or face == self._face_str or not isinstance(face, str):
+                return
+            self._face_str = face
+            face_id = FACE_STR_TO_ID.get(face, 0)
+            if face_id != self._face_id:
+                self._face_id = face_id
+                self._wake("face")
         except Exception:
             pass
 
     def on_unloaded(self):
         self._stop.set()
+        self._sched.close()
         try:
             if self._thread:
                 self._thread.join(timeout=2)
+            if self._watch_thread:
+                self._watch_thread.join(timeout=2)
         except Exception:
             pass
         try:
-            self._run(["/usr/bin/hcitool","-i",self.opts["hci"],"cmd","0x08","0x000a","00"])
+            adv = self._advertiser()
+            adv.set_enable(False)
+            adv.close()
         except Exception:
             pass
+        if self._watcher is not None:
+            self._watcher.close()
+        if self._sources is not None:
+            self._sources.close()
+        if self.metrics.diag is not None:
+            self.metrics.diag.write("on_unloaded", **self.counters)
+            self.metrics.diag.close()
 
-    def _run(self, cmd, timeout=3):
-        try:
-            p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=False)
-            return p.returncode == 0
-        except Exception:
-            return False
+    def on_webhook(self, path, request):
+        # GET /plugins/ble_beacon/ -> JSON counters, timings and HCI status histogram
+        body = json.dumps(self.stats(), sort_keys=True)
+        return body, 200, {"Content-Type": "application/json"}
+
+    def stats(self):
+        out = self.metrics.snapshot()
+        out["counters"] = dict(self.counters)
+        out["backend"] = self._adv.name if self._adv is not None else None
+        out["adv_interval_ms"] = round(self._adv_units * 0.625, 1)
+        out["face_id"] = self._face_id
+        out["session"] = dict(self.session)
+        return out
+
+    def _advertiser(self):
+        if self._adv is None:
+            self._adv = make_advertiser(self.opts.get("backend", "auto"), self.opts["hci"])
+        self._adv.metrics = self.metrics
+        return self._adv
 
     def _read_age_json(self):
-        d = {}
-        p = self.opts["age_json"]
-        try:
-            if os.path.exists(p):
-                with open(p, "r") as f:
-                    d = json.load(f)
-        except Exception:
-            pass
-        hs = int(d.get("handshakes", 0))
-        pts = int(d.get("points", 0))
-        ep = int(d.get("epochs", 0))
-        tr = int(d.get("train_epochs", d.get("trainings", 0)))
-        return hs, pts, ep, tr
+        if self._age_snap is None:
+            self._age_snap = JsonSnapshot(self.opts["age_json"], _extract_age, (0, 0, 0, 0))
+        return self._age_snap.read()
 
     def _read_traveler_json(self):
-        p = self.opts.get("traveler_json", "/root/pwn_traveler.json")
-        xp = 0
-        try:
-            if os.path.exists(p):
-                with open(p, "r") as f:
-                    d = json.load(f)
-                xp = int(d.get("travel_xp", 0))
-        except Exception:
-            pass
-        return xp
+        if self._traveler_snap is None:
+            self._traveler_snap = JsonSnapshot(self.opts.get("traveler_json", "/root/pwn_traveler.json"),
+                                               _extract_traveler, 0)
+        return self._traveler_snap.read()
+
+    def _sensors(self):
+        if self._sources is None:
+            self._sources = SensorSources(self.opts)
+        return self._sources
 
     def _read_cpu_temp(self):
-        try:
-            with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
-                milli = int(f.read().strip())
-            c = max(0.0, min(127.5, milli / 1000.0))
-            return int(round(c * 2.0))
-        except Exception:
+        c = self._sensors().read("cpu_temp_c")
+        if c is None:
             return 0
+        return int(round(max(0.0, min(127.5, c)) * 2.0))
 
-    def _build_payload_v5(self):
+    def _read_stats(self):
+        clock, m = time.perf_counter, self.metrics
+        t0 = clock()
         hs, pts, ep, tr = self._read_age_json()
-        tx2 = self._read_cpu_temp()
+        t1 = clock()
         trav_xp = self._read_traveler_json()
+        t2 = clock()
+        tx2 = self._read_cpu_temp()
+        t3 = clock()
+        m.time("read_age", t1 - t0)
+        m.time("read_traveler", t2 - t1)
+        m.time("read_cpu_temp", t3 - t2)
+        return {
+            "handshakes": hs,
+            "points": pts,
+            "epochs": ep,
+            "train_epochs": tr,
+            "cpu_temp_x2": tx2,
+            "traveler_xp": trav_xp,
+            "face_id": self._face_id,
+            "face_rev": FACE_REV,
+        }
 
-        hs = max(0, min(65535, hs))
-        pts = max(0, min(65535, pts))
-        ep = max(0, min(65535, ep))
-        trav_xp = max(0, min(65535, trav_xp))
-        tr = max(0, min(65535, tr))
-        tx2 = max(0, min(255, tx2))
+    def _build_payload(self, version):
+        stats = self._read_stats()
+        if version < 7 and self.opts.get("wrap_counters", False):
+            # lets the integration rebuild full totals from the 16-bit values
+            for name in WIDE_COUNTERS:
+                stats[name] &= 0xFFFF
+        if not self.opts.get("broadcast_face", True):
+            stats["face_id"] = 0
+        t0 = time.perf_counter()
+        payload = FRAME_SCHEMAS[version].pack(stats)
+        self.metrics.time("pack", time.perf_counter() - t0)
+        return payload
 
-        return struct.pack("<BHHHBHH", 5, hs, pts, ep, tx2, trav_xp, tr)
+    def _read_health(self):
+        snap = self._sensors().snapshot()
+        battery, load1, mem, uptime = snap["battery_pct"], snap["load1"], snap["mem_pct"], snap["uptime_s"]
+        return {
+            "battery_pct": BATTERY_UNKNOWN if battery is None else min(100, int(round(battery))),
+            "uptime_s": int(uptime or 0),
+            "load1_x100": int(round((load1 or 0.0) * 100)),
+            "mem_pct": int(round(mem or 0.0)),
+        }
 
-    def _build_payload_v6(self):
-        hs, pts, ep, tr = self._read_age_json()
-        tx2 = self._read_cpu_temp()
-        trav_xp = self._read_traveler_json()
+    def _build_frame(self, version):
+        """Payload for a secondary (health/session) frame."""
+        stats = self._read_health() if version == KIND_HEALTH else self.session
+        t0 = time.perf_counter()
+        payload = FRAME_SCHEMAS[version].pack(stats)
+        self.metrics.time("pack", time.perf_counter() - t0)
+        return payload
 
-        hs = max(0, min(65535, hs))
-        pts = max(0, min(65535, pts))
-        ep = max(0, min(65535, ep))
-        trav_xp = max(0, min(65535, trav_xp))
-        tr = max(0, min(65535, tr))
-        tx2 = max(0, min(255, tx2))
+    def _rotation(self):
+        periods = {KIND_SESSION: self.opts.get("session_s", 0)}
+        if not self.opts.get("scan_response", False):
+            periods[KIND_HEALTH] = self.opts.get("health_s", 0)
+        return FrameRotation(self._frame_version(), periods, self.opts.get("frame_dwell_s", 5), time.monotonic())
 
-        face_id = int(self._face_id) & 0xFF
-        face_rev = int(FACE_REV) & 0xFF
+    def _build_payload_v5(self):
+        return self._build_payload(5)
+
+    def _build_payload_v6(self):
+        return self._build_payload(6)
 
-        # <BHHHBHHBB> = ver(6), hs, pts, ep, cpu*2, trav_xp, train_ep, face_id, face_rev
-        return struct.pack("<BHHHBHHBB", 6, hs, pts, ep, tx2, trav_xp, tr, face_id, face_rev)
+    def _frame_version(self):
+        if self.opts.get("wide_counters", False):
+            return 7
+        return 6 if self.opts.get("broadcast_face", True) else 5
 
-    def _ble_set_adv(self, payload: bytes):
-        hci = self.opts["hci"]
+    def _adv_data(self, payload: bytes, flags=True) -> bytes:
         cid = int(self.opts["company_id"]) & 0xFFFF
-        flags = bytes([2, 0x01, 0x06])
         mfg = bytes([len(payload) + 3, 0xFF, cid & 0xFF, (cid >> 8) & 0xFF]) + payload
-        adv = flags + mfg
+        # scan response data carries no flags AD
+        adv = bytes([2, 0x01, 0x06]) + mfg if flags else mfg
         if len(adv) > 31:
             adv = adv[:31]
         pad = bytes([0x00] * (31 - len(adv)))
-        data = bytes([len(adv)]) + adv + pad
+        return bytes([len(adv)]) + adv + pad
+
+    def _ble_set_adv(self, payload: bytes, scan_payload=None):
+        hci = self.opts["hci"]
+        data = self._adv_data(payload)
+        scan_data = None if scan_payload is None else self._adv_data(scan_payload, flags=False)
+        adv_backend = self._advertiser()
+        try:
+            return adv_backend.advertise(data, self._adv_units, scan_data)
+        except OSError as e:
+            # socket went away (adapter reset, unplugged dongle...): drop it; the socket
+            # backend reopens it on the next tick, and in auto mode this tick uses hcitool
+            adv_backend.close()
+            self.metrics.error("hci_socket", e)
+            if adv_backend.name != "socket":
+                self._adv = None
+            elif self.opts.get("backend", "auto") == "auto":
+                LOGGER.debug("ble_beacon: HCI socket error (%s), using hcitool for this update", e)
+                fallback = HcitoolAdvertiser(hci)
+                fallback.metrics = self.metrics
+                return fallback.advertise(data, self._adv_units, scan_data)
+            return [HCI_STATUS_NO_REPLY]
 
-        self._run(["/usr/bin/hcitool","-i",hci,"cmd","0x08","0x000a","00"])
-        self._run(["/usr/bin/hciconfig", hci, "leadv", "0"])
-        self._run(["/usr/bin/hciconfig", hci, "up"])
-        hexbytes = [f"{b:02x}" for b in data]
-        self._run(["/usr/bin/hcitool","-i",hci,"cmd","0x08","0x0008", *hexbytes[:31]])
-        self._run(["/usr/bin/hcitool","-i",hci,"cmd","0x08","0x000a","01"])
-        self._run(["/usr/bin/hciconfig", hci, "leadv", "3"])
+    def _advertise_if_changed(self, payload: bytes, scan_payload=None) -> bool:
+        """Program the controller unless it already carries these exact bytes.
+
+        An unchanged payload is still re-asserted every ``refresh_s`` seconds in case
+        something else (bluetoothd, an adapter reset) clobbered the advertising state.
+        Returns True when the controller was programmed.
+        """
+        data = (payload, scan_payload)
+        now = time.monotonic()
+        refresh = float(self.opts.get("refresh_s", 300) or 0)
+        unchanged = data == self._last_data and self._adv_units == self._last_units
+        if unchanged and refresh > 0 and now - self._last_programmed < refresh:
+            self.counters["skipped"] += 1
+            return False
+        statuses = self._ble_set_adv(payload, scan_payload)
+        if statuses and all(st == 0 for st in statuses):
+            self._last_data = data
+            self._last_units = self._adv_units
+            self._last_programmed = now
+            self.counters["programmed"] += 1
+        else:
+            # forget the cache so the next tick retries instead of skipping
+            self._last_data = None
+            self.counters["failed"] += 1
+        return True
+
+    def _watch_loop(self):
+        # turns inotify events on the JSON files into loop wake-ups
+        while not self._stop.is_set():
+            if self._watcher.wait_changed(1.0):
+                self._wake("file")
 
     def _loop(self):
         interval = int(self.opts.get("interval_s", 20))
-        use_face = bool(self.opts.get("broadcast_face", True))
+        version = self._frame_version()
+        adaptive = None
+        if self.opts.get("schedule", "fixed") == "adaptive":
+            adaptive = AdaptiveInterval(self.opts.get("min_interval_s", 5), self.opts.get("max_interval_s", 120), interval)
+        else:
+            self._adv_units = adv_interval_units(float(self.opts.get("adv_interval_ms", 1280)))
+        last_payload = None
+        diag = self.metrics.diag
+        if diag is not None:
+            diag.write("loop_start", interval_s=interval, adaptive=adaptive is not None)
+        rotation = self._rotation()
+        scan_s = float(self.opts.get("health_s", 0) or 0) if self.opts.get("scan_response", False) else 0.0
+        scan_due = 0.0
+        reasons = set()
         while not self._stop.is_set():
+            t0 = time.perf_counter()
+            sent = False
+            frame = version
             try:
-                payload = self._build_payload_v6() if use_face else self._build_payload_v5()
-                self._ble_set_adv(payload)
-            except Exception:
-                pass
-            self._stop.wait(interval)
+                payload = self._build_payload(version)
+                changed = payload != last_payload
+                if adaptive is not None:
+                    interval = adaptive.update(changed, sleeping=self._face_id == 1)
+                    # spread adv_per_update adverts over the update period
+                    per = max(1, int(self.opts.get("adv_per_update", 10)))
+                    self._adv_units = adv_interval_units(interval * 1000.0 / per)
+                last_payload = payload
+                now = time.monotonic()
+                frame = rotation.pick(now, changed)
+                if frame != version:
+                    payload = self._build_frame(frame)
+                if scan_s and now >= scan_due:
+                    self._scan_payload = self._build_frame(KIND_HEALTH)
+                    scan_due = now + scan_s
+                sent = self._advertise_if_changed(payload, self._scan_payload)
+                rotation.sent(frame, now)  # skipped means it is already on air
+            except Exception as e:
+                LOGGER.debug("ble_beacon: tick failed: %r", e)
+                self.metrics.error("tick", e)
+            dt = time.perf_counter() - t0
+            self.metrics.time("tick", dt)
+            if diag is not None and (sent or reasons):
+                diag.write("tick", why=",".join(sorted(reasons)) or "timer", sent=sent, frame=frame,
+                           ms=round(dt * 1e3, 2), **self.counters)
+            LOGGER.debug("ble_beacon: programmed=%(programmed)d skipped=%(skipped)d failed=%(failed)d", self.counters)
+            hold = rotation.hold(frame, interval)
+            due = time.monotonic() + hold
+            reasons = self._sched.wait(hold)
+            if not reasons and not self._stop.is_set():
+                # how late the periodic wake-up was
+                self.metrics.jitter.add(max(0.0, time.monotonic() - due))
+            elif reasons:
+                LOGGER.debug("ble_beacon: woken early by %s", ",".join(sorted(reasons)))